@@ -10,6 +10,18 @@ function stopDownload(url){
     document.querySelector('#stop_download').click()
 }
 
+var backendActionTarget = null;
+
+function getTargetForBackendAction(label){
+    return backendActionTarget;
+}
+
+function backendAction(action, label){
+    backendActionTarget = label;
+
+    document.querySelector('#backend_' + action).click()
+}
+
 function setupDownloadUpdates(){
     button = document.querySelector('#refresh_downloads');
     if(button && document.querySelector('.downloads .download.active'))
@@ -19,3 +31,24 @@ function setupDownloadUpdates(){
 }
 
 setupDownloadUpdates();
+
+var serverLogMaxLength = 200000;
+
+function appendServerLog(json){
+    var log = document.querySelector('#server_log');
+    if(!log || !json)
+        return;
+
+    var chunk = JSON.parse(json);
+    var atBottom = log.scrollTop + log.clientHeight >= log.scrollHeight - 20;
+
+    if(chunk.reset)
+        log.textContent = '';
+
+    log.textContent += chunk.text;
+    if(log.textContent.length > serverLogMaxLength)
+        log.textContent = log.textContent.slice(-serverLogMaxLength);
+
+    if(atBottom)
+        log.scrollTop = log.scrollHeight;
+}
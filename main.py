@@ -1,4 +1,4 @@
-from modules import settings, shared, shared_options, ui_main, cmd_args, userscripts
+from modules import settings, shared, shared_options, ui_main, cmd_args, userscripts, proxy, metrics, telemetry
 
 
 def main():
@@ -12,8 +12,13 @@ def main():
     launcher = ui_main.LlmLauncher()
     ui = launcher.create_ui(settings_ui)
 
-    ui.queue(default_concurrency_limit=10).launch(prevent_thread_lock=True, favicon_path="assets/favicon.png", allowed_paths=["assets"])
+    app, _, _ = ui.queue(default_concurrency_limit=10).launch(prevent_thread_lock=True, favicon_path="assets/favicon.png", allowed_paths=["assets"])
+    metrics.add_route(app, launcher)
 
+    proxy.start(launcher)
+    launcher.run_snapshot_producer()
+    telemetry.sampler.run(launcher.pool)
+    launcher.pool.run_idle_unloader()
     launcher.launch_at_startup()
 
     ui.block_thread()
@@ -1,21 +1,95 @@
 import os
-import queue
+import random
+import select
+import re
 import shlex
 import signal
+import sqlite3
 import subprocess
 import threading
 import time
 
-from modules import templating, models, shared
+import requests
+
+from modules import templating, models, shared, utils, output_reader, errors, stats_db, request_stats, log_archive, model_info_cache
+
+
+class AdmissionError(Exception):
+    def __init__(self, code, message, retry=False):
+        super().__init__(message)
+        self.code = code
+        self.retry = retry
+
+
+class AdoptedProcess:
+    """
+    Popen-like handle for a server process started by a previous run of the launcher.
+
+    Its exit code can't be known, so -1 is reported once it exits.
+    """
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.returncode = None
+
+    def poll(self):
+        if self.returncode is None and not utils.pid_alive(self.pid):
+            self.returncode = -1
+
+        return self.returncode
+
+    def wait(self, timeout=None):
+        if self.returncode is not None:
+            return self.returncode
+
+        deadline = None if timeout is None else time.time() + timeout
+
+        try:
+            fd = os.pidfd_open(self.pid)
+        except (AttributeError, OSError):
+            fd = None
+
+        if fd is not None:
+            try:
+                select.select([fd], [], [], timeout)
+            finally:
+                os.close(fd)
+
+        while self.poll() is None:
+            if deadline is not None and time.time() >= deadline:
+                raise subprocess.TimeoutExpired(str(self.pid), timeout)
+
+            time.sleep(0.2)
+
+        return self.returncode
+
+    def terminate(self):
+        os.kill(self.pid, signal.SIGTERM)
+
+    def kill(self):
+        os.kill(self.pid, signal.SIGKILL)
+
+
+max_startup_log_lines = 10000
+
+cached_model_info_fields = ['model_arch', 'model_chat_template', 'model_chat_template_vars', 'model_tensor_info', 'model_size', 'model_param_count']
+
+re_memory_failure = re.compile(r'out of memory|failed to allocate|unable to allocate|cudaMalloc failed|bad_alloc|OutOfMemoryError|ErrorOutOfDeviceMemory', re.IGNORECASE)
 
 
 class BackendBase:
     backend_type = 'none'
+    health_path = '/health'
 
     def __init__(self):
         self.server_process = None
+        self.server_output = None
         self.server_reader = None
         self.chdir = None
+        self.log_path = None
+        self.adopted_process = None
+        self.on_process_started = None
+        self.log_paths_in_use = None
 
         self.model: models.ModelInfo = None
         self.model_arch = None
@@ -29,22 +103,207 @@ class BackendBase:
         self.model_size = None
         self.model_param_count = None
         self.build_info = None
+        self.build_version = None
         self.access_url = None
-
-        self.over = False
-        self.ready = False
+        self.port = None
+        self.memory_size = 0
+        self.last_used = time.time()
+        self.started_on_demand = False
+        self.info_loaded = False
+        self.timings: dict[str, float] = {}
+
+        self.state_changed = threading.Condition()
+        self._over = False
+        self._ready = False
+        self.active_requests = 0
+        self.queued_requests = 0
+        self.slots = None
+        self.retired = False
+        self.stopping = False
+        self.switchover_message = None
+        self.stop_report = None
+
+        self.process_started_at = None
+        self.restart_count = 0
+        self.fast_failures = 0
+        self.killed_by_launcher = False
+        self.profile_index = 0
+
+        self.probe_thread = None
+        self.probe_healthy = False
+        self.probe_answered_at = 0
+        self.probe_failures = 0
+        self.probe_latency = None
+        self.collector = None
+        self.collector_thread = None
+        self.server_stats = None
         self.server_thread = None
         self.status_message: str = None
         self.startup_log = ''
         self.commandline = ''
         self.extra_paths = None
 
+    @property
+    def over(self):
+        return self._over
+
+    @over.setter
+    def over(self, value):
+        with self.state_changed:
+            self._over = value
+            self.state_changed.notify_all()
+
+    @property
+    def ready(self):
+        return self._ready
+
+    @ready.setter
+    def ready(self, value):
+        with self.state_changed:
+            self._ready = value
+            self.state_changed.notify_all()
+
+    def wait_ready(self, timeout):
+        """Blocks until the server is ready, stopped, or timeout expires; returns whether it's ready."""
+
+        deadline = time.time() + timeout
+
+        with self.state_changed:
+            while not self._ready and not self._over:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+
+                self.state_changed.wait(remaining)
+
+            return self._ready
+
+    def wait_over(self, timeout):
+        """Waits until the backend is stopped or timeout passes; returns True if it's stopped."""
+
+        with self.state_changed:
+            return self.state_changed.wait_for(lambda: self.over, timeout)
+
+    def concurrency_limit(self):
+        return int(shared.opts.proxy_concurrency_limit or self.slots or 0)
+
+    def can_admit(self):
+        limit = self.concurrency_limit()
+        return self._ready and not self._over and not self.retired and (not limit or self.active_requests < limit)
+
+    def admit(self, timeout, max_queue):
+        """
+        Waits until the server is ready and has a free slot, then counts the request as active.
+
+        Raises AdmissionError if the queue is full, the server is stopped, or the wait times out.
+        Every successful call must be paired with release().
+        """
+
+        deadline = time.time() + timeout
+
+        with self.state_changed:
+            if self.stopping and not self.retired:
+                raise AdmissionError(503, f"Backend for {self.model.label} is stopping")
+
+            if not self.can_admit() and self.queued_requests >= max_queue:
+                raise AdmissionError(429, f"Too many requests queued for {self.model.label}")
+
+            self.queued_requests += 1
+            try:
+                while not self.can_admit():
+                    if self.retired:
+                        raise AdmissionError(503, f"Backend for {self.model.label} was replaced", retry=True)
+
+                    if self._over:
+                        raise AdmissionError(503, f"Backend for {self.model.label} is stopped")
+
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise AdmissionError(503, f"Timed out waiting for {self.model.label}: {self.status_message}")
+
+                    self.state_changed.wait(remaining)
+
+                self.active_requests += 1
+            finally:
+                self.queued_requests -= 1
+
+        self.touch()
+
+    def release(self):
+        with self.state_changed:
+            self.active_requests -= 1
+            self.state_changed.notify_all()
+
+        self.touch()
+
+    def retire(self):
+        """Stops admitting requests; the ones waiting in the queue are told to retry with the new backend."""
+
+        with self.state_changed:
+            self.retired = True
+            self.state_changed.notify_all()
+
+    def drain(self, timeout):
+        """Waits for queued and active requests to finish; returns how many are still queued or running after timeout."""
+
+        deadline = time.time() + timeout
+
+        with self.state_changed:
+            while self.active_requests + self.queued_requests > 0 and not self._over:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+
+                self.state_changed.wait(remaining)
+
+            return self.active_requests + self.queued_requests
+
+    def uptime(self):
+        return time.time() - self.process_started_at if self.process_started_at else None
+
+    def touch(self):
+        self.last_used = time.time()
+
+    def is_idle(self, ttl):
+        return ttl > 0 and self.ready and self.active_requests == 0 and time.time() - self.last_used > ttl
+
+    @classmethod
+    def default_port(cls):
+        return None
+
+    @classmethod
+    def default_host(cls):
+        return None
+
+    def connect_host(self):
+        host = self.default_host()
+        return '127.0.0.1' if host in (None, '', '0.0.0.0') else host
+
+    def base_url(self):
+        return f"http://{self.connect_host()}:{self.port}"
+
     def cmd(self) -> list[str]:
         raise NotImplementedError()
 
+    def create_server_collector(self):
+        """Returns an object whose collect() method polls the server for stats, or None if the backend has nothing to poll."""
+
+        return None
+
     def create_server_reader(self):
         raise NotImplementedError()
 
+    def fallback_profiles(self) -> list[str]:
+        """Lists of extra command line options to use one after another when the server runs out of memory."""
+
+        return []
+
+    def is_memory_failure(self, code):
+        if code in (-9, 137) and not self.killed_by_launcher:
+            return True
+
+        return re_memory_failure.search(self.startup_log) is not None
+
     def detect_started_line(self, line):
         raise NotImplementedError()
 
@@ -57,60 +316,224 @@ class BackendBase:
     def status(self, message):
         self.status_message = message
 
+    def load_model_info(self):
+        """Sets model_* fields from the model info cache, or reads them from model files with read_model_info and stores them in the cache."""
+
+        signature = model_info_cache.files_signature(self.model.fullpath)
+
+        data = model_info_cache.cache.get(self.model.fullpath, signature)
+        if data is not None:
+            for field, value in data.items():
+                setattr(self, field, value)
+
+            self.model_chat_template_vars = {'messages': self.sample_messages(), **self.model_chat_template_vars}
+            return
+
+        self.read_model_info()
+
+        data = {x: getattr(self, x) for x in cached_model_info_fields}
+        data['model_chat_template_vars'] = {k: v for k, v in (self.model_chat_template_vars or {}).items() if k != 'messages'}
+        model_info_cache.cache.put(self.model.fullpath, data, signature)
+
+    def load_info(self):
+        """Reads model metadata for the Info tab; runs in its own thread while the server is starting."""
+
+        start = time.time()
+        try:
+            self.load_model_info()
+        except Exception as e:
+            errors.display(e, full_traceback=True)
+
+        self.timings['reading model info'] = time.time() - start
+
+        start = time.time()
+        try:
+            self.write_down_template()
+        except Exception as e:
+            errors.display(e, full_traceback=True)
+
+        self.timings['rendering chat template'] = time.time() - start
+        self.info_loaded = True
+
+    def timings_markdown(self):
+        return "| phase | seconds |\n|---|---|\n" + "\n".join(f"| {k} | {v:.2f} |" for k, v in list(self.timings.items()))
+
+    def log_max_size(self):
+        return int(shared.opts.log_max_size_mb * 1024 * 1024)
+
+    def attach_server(self):
+        """Picks up a server process left running by a previous run of the launcher instead of starting a new one."""
+
+        self.server_process, self.adopted_process = self.adopted_process, None
+        self.status('Attaching to running server...')
+
+        log_lines = []
+        with open(self.log_path, 'r', encoding='utf8', errors='ignore') as f:
+            for line in f:
+                log_lines.append(line)
+                if self.detect_started_line(line) or len(log_lines) >= max_startup_log_lines:
+                    break
+
+        self.startup_log = ''.join(log_lines)
+
+        self.access_url = self.access_url or utils.extract_url(f"http://{self.default_host() or '0.0.0.0'}:{self.port}")
+
+        self.server_output = output_reader.LogFollower(self.log_path, self.server_process, from_end=True, max_size=self.log_max_size())
+        self.server_reader = self.create_reader()
+        self.server_reader.start()
+
+        self.process_startup_log()
+
+        self.status(f"✅ Reattached to server listening on {self.access_url}")
+        self.ready = True
+
+    def create_reader(self):
+        """Creates a reader for server output that records requests to the stats database, with stats for recent requests loaded from it."""
+
+        reader = self.create_server_reader()
+        reader.on_request = lambda stat: stats_db.db.record(self, stat)
+
+        if shared.opts.stats_db:
+            stats_db.db.flush()
+
+            try:
+                for row in stats_db.db.recent_requests(self.model.path, time.time() - max(request_stats.windows.values())):
+                    reader.stats.add(*row, lifetime=False)
+            except sqlite3.Error as e:
+                errors.display(e, 'loading request stats')
+
+        return reader
+
+    def state(self):
+        """What's needed to find and reattach to the server process after the launcher restarts."""
+
+        return {
+            "label": self.model.label,
+            "pid": self.server_process.pid,
+            "cmd": shlex.split(self.commandline),
+            "port": self.port,
+            "log_path": self.log_path,
+            "started_at": self.process_started_at,
+            "profile_index": self.profile_index,
+            "started_on_demand": self.started_on_demand,
+        }
+
     def start_server(self):
         self.ready = False
 
+        if self.adopted_process is not None:
+            self.attach_server()
+            return
+
         cmd = self.cmd()
 
+        if self.profile_index:
+            cmd += shlex.split(self.fallback_profiles()[self.profile_index - 1])
+
+        self.killed_by_launcher = False
+        self.startup_log = ''
+
         env = {**os.environ, **dict(COLUMNS="9999")}
         if self.extra_paths:
             env["PATH"] = os.pathsep.join(self.extra_paths) + os.pathsep + os.environ.get("PATH", "")
 
+        launch_start = time.time()
+
+        self.log_path = log_archive.new_log_path(self.model.alias, self.port)
+        os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+
         self.commandline = shlex.join(cmd)
-        self.server_process = subprocess.Popen(
-            cmd,
-            cwd=self.chdir,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            bufsize=1,
-            text=True,
-            errors='ignore',
-            env=env,
-        )
-
-        self.server_reader = self.create_server_reader()
+
+        if shared.opts.keep_backends_running:
+            # the server writes to the log file directly and gets its own session, so that it outlives the launcher
+            detach_args = dict(creationflags=subprocess.CREATE_NEW_PROCESS_GROUP) if os.name == 'nt' else dict(start_new_session=True)
+
+            # opened for appending so that the launcher can rotate the log by truncating it
+            with open(self.log_path, 'a', encoding='utf8') as log_file:
+                self.server_process = subprocess.Popen(
+                    cmd,
+                    cwd=self.chdir,
+                    stdout=log_file,
+                    stderr=subprocess.STDOUT,
+                    env=env,
+                    **detach_args,
+                )
+
+            self.server_output = output_reader.LogFollower(self.log_path, self.server_process, max_size=self.log_max_size())
+        else:
+            self.server_process = subprocess.Popen(
+                cmd,
+                cwd=self.chdir,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                bufsize=1,
+                text=True,
+                errors='ignore',
+                env=env,
+            )
+
+            self.server_output = output_reader.LogTee(self.server_process.stdout, self.log_path, max_size=self.log_max_size())
+
+        in_use = self.log_paths_in_use() if self.log_paths_in_use else []
+        log_archive.prune(self.model.alias, shared.opts.log_retention_runs, in_use=[self.log_path, *in_use])
+
+        self.server_reader = self.create_reader()
+        startup_lines = self.server_reader.bus.subscribe(max_startup_log_lines)
+        self.server_reader.start()
+
+        self.timings['starting process'] = time.time() - launch_start
+        self.timings.pop('first output', None)
+        self.timings.pop('ready', None)
+
+        if self.on_process_started:
+            self.on_process_started()
 
         ready = False
         start = time.time()
+        self.probe_healthy = False
+        self.probe_failures = 0
 
         self.status('Waiting for server to start...')
 
+        log_lines = []
         while True:
-            try:
-                line = self.server_reader.queue.get(timeout=0.2)
-                if line:
-                    self.startup_log += line
-                    start = time.time()
-
-                    if self.detect_started_line(line):
-                        ready = True
-                        break
-
-            except queue.Empty:
-                if self.server_process.poll() is not None:
-                    self.status("❌ Server exited before it was ready.")
-                    self.over = True
+            line = startup_lines.get(timeout=0.2)
+            if line:
+                if len(log_lines) < max_startup_log_lines:
+                    log_lines.append(line)
+
+                start = time.time()
+                self.timings.setdefault('first output', start - launch_start)
+
+                if self.detect_started_line(line):
+                    ready = True
                     break
 
+            elif self.server_process.poll() is not None:
+                self.status("❌ Server exited before it was ready.")
+                break
+
+            if self.probe_healthy:
+                self.access_url = self.access_url or utils.extract_url(f"http://{self.default_host() or '0.0.0.0'}:{self.port}")
+                ready = True
+                break
+
+            start = max(start, self.probe_answered_at)
+
             if time.time() - start > shared.opts.backend_startup_timeout:
                 self.status("❌ Timed out waiting for output from server.")
-                self.startup_log += "\nTimed out."
-                self.over = True
+                log_lines.append("\nTimed out.")
+                self.kill_server()
                 break
 
+        startup_lines.unsubscribe()
+        self.startup_log = ''.join(log_lines)
+
         if not ready:
             return
 
+        self.timings['ready'] = time.time() - launch_start
+
         self.process_startup_log()
 
         if self.access_url is not None:
@@ -118,6 +541,9 @@ class BackendBase:
         else:
             self.status("✅ Ready!")
 
+        if self.profile_index:
+            print(f"{self.model.label} started with fallback profile {self.profile_index}: {self.fallback_profiles()[self.profile_index - 1]}")
+
         self.ready = True
 
     def run(self):
@@ -128,31 +554,170 @@ class BackendBase:
         self.server_thread = threading.Thread(target=self.server_thread_main, daemon=True)
         self.server_thread.start()
 
+        if shared.opts.health_probe_interval > 0:
+            self.probe_thread = threading.Thread(target=self.probe_thread_main, daemon=True)
+            self.probe_thread.start()
+
+        self.collector = self.create_server_collector()
+        if self.collector is not None and shared.opts.server_stats_interval > 0:
+            self.collector_thread = threading.Thread(target=self.collector_thread_main, daemon=True)
+            self.collector_thread.start()
+
+    def probe_health(self):
+        """Requests the health endpoint; returns True if the server is ready, False if it answers but is not ready, None if it doesn't answer."""
+
+        start = time.time()
+
+        try:
+            response = requests.get(self.base_url() + self.health_path, timeout=shared.opts.health_probe_timeout)
+        except requests.RequestException:
+            return None
+
+        self.probe_latency = (time.time() - start) * 1000
+        self.probe_answered_at = time.time()
+
+        return response.status_code == 200
+
+    def probe_thread_main(self):
+        """Marks the server ready as soon as its health endpoint answers, and kills it if it stops answering, so that it's restarted."""
+
+        while not self.wait_over(shared.opts.health_probe_interval):
+            process = self.server_process
+            if not self.port or process is None or process.poll() is not None:
+                continue
+
+            healthy = self.probe_health()
+
+            if healthy:
+                self.probe_healthy = True
+                self.probe_failures = 0
+                continue
+
+            if not self.ready:
+                continue
+
+            self.probe_failures += 1
+            if self.probe_failures < shared.opts.health_probe_failures or process.poll() is not None:
+                continue
+
+            self.status(f"❌ Server failed {self.probe_failures} health checks in a row; restarting.")
+            self.probe_failures = 0
+            self.ready = False
+
+            self.kill_server()
+
+    def collector_thread_main(self):
+        """Polls the server for stats it doesn't write to its output while it's ready."""
+
+        while not self.wait_over(shared.opts.server_stats_interval):
+            if not self.ready:
+                self.server_stats = None
+                continue
+
+            try:
+                self.server_stats = self.collector.collect()
+            except Exception as e:
+                errors.display_once(e, f'collecting stats from {self.model.label}')
+                self.server_stats = None
+                continue
+
+            if self.server_stats.slots:
+                self.slots = len(self.server_stats.slots)
+
+    def restart_delay(self):
+        """Exponential backoff with jitter for restarting after fast failures; no delay after a normal run."""
+
+        if not self.fast_failures:
+            return 0
+
+        delay = min(shared.opts.restart_backoff_max, 2 ** (self.fast_failures - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
     def server_thread_main(self):
         while not self.over:
+            if self.adopted_process is None:
+                self.process_started_at = time.time()
+
             self.start_server()
 
-            while True:
-                code = self.server_process.poll()
+            code = self.server_process.wait()
+            uptime = time.time() - self.process_started_at
 
-                if code is not None:
-                    break
+            self.ready = False
+            self.process_started_at = None
 
-                time.sleep(1)
+            if self.over or self.stopping:
+                self.status(f"Server process exited with code {code}; quitting")
+                self.over = True
+                break
 
-            self.ready = False
-            self.status(f"Server process exited with code {code}; {'quitting' if self.over else 'restarting'}")
+            if self.is_memory_failure(code) and self.profile_index < len(self.fallback_profiles()):
+                self.profile_index += 1
+                self.fast_failures = 0
+                self.restart_count += 1
+                self.status(f"Server process ran out of memory (exit code {code}); restarting with fallback profile {self.profile_index}: {self.fallback_profiles()[self.profile_index - 1]}")
+                continue
+
+            if uptime < shared.opts.crash_loop_uptime:
+                self.fast_failures += 1
+            else:
+                self.fast_failures = 0
+
+            if shared.opts.crash_loop_failures and self.fast_failures >= shared.opts.crash_loop_failures:
+                self.status(f"❌ Server process exited with code {code}; it failed {self.fast_failures} times in a row within {shared.opts.crash_loop_uptime:g}s of starting, giving up.")
+                self.over = True
+                break
+
+            delay = self.restart_delay()
+            self.restart_count += 1
+            self.status(f"Server process exited with code {code}; restarting" + (f" in {delay:.1f}s" if delay else ""))
+
+            with self.state_changed:
+                self.state_changed.wait_for(lambda: self._over, timeout=delay)
 
         self.server_process = None
 
+    def kill_server(self):
+        process = self.server_process
+        if process and process.poll() is None:
+            self.killed_by_launcher = True
+            process.kill()
+
     def stop_server(self):
+        """
+        Stops admitting new requests and waits for queued and active ones to finish, up to the drain timeout.
+        Then asks the server to exit, and kills it if it doesn't exit in time.
+        """
+
+        with self.state_changed:
+            self.stopping = True
+            self.state_changed.notify_all()
+
+        process = self.server_process
+        if not process or process.poll() is not None:
+            self.over = True
+            return
+
+        active = self.active_requests + self.queued_requests
+        if active:
+            self.status(f'Waiting for {active} requests to finish...')
+
+        aborted = self.drain(shared.opts.drain_timeout)
         self.over = True
+        self.stop_report = f"{active - aborted} requests drained, {aborted} aborted"
 
-        if self.server_process and self.server_process.poll() is None:
-            self.status('Stopping server...')
+        self.status('Stopping server...')
+        self.killed_by_launcher = True
+
+        process.terminate()
+        try:
+            process.wait(timeout=shared.opts.shutdown_timeout)
+        except subprocess.TimeoutExpired:
+            self.stop_report += ", killed after shutdown timeout"
+            process.kill()
+            process.wait()
 
-            os.kill(self.server_process.pid, signal.SIGTERM if os.name == 'nt' else signal.SIGKILL)
-            self.server_process.wait()
+        print(f"Stopped {self.model.label}: {self.stop_report}")
 
     def sample_messages(self):
         return [
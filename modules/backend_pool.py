@@ -0,0 +1,312 @@
+import json
+import os
+import shlex
+import threading
+import time
+
+from modules import backend, models, shared, utils, errors
+
+
+state_filename = os.path.join(shared.script_path, 'backends.json')
+
+
+def model_disk_size(model_info: models.ModelInfo):
+    if os.path.isfile(model_info.fullpath):
+        return os.path.getsize(model_info.fullpath)
+
+    total = 0
+    for root, _, files in os.walk(model_info.fullpath):
+        for filename in files:
+            total += os.path.getsize(os.path.join(root, filename))
+
+    return total
+
+
+class BackendPool:
+    """
+    Collection of running backends keyed by model label.
+
+    Every backend gets its own port: the port from the backend's settings if it's free,
+    otherwise the first free port from the configured range. The memory budget limits
+    total size of models that are resident at the same time; least recently used
+    backends are stopped to make room for a new one.
+
+    Requests that don't name a model go to the active backend, which is the one started last.
+    """
+
+    def __init__(self):
+        self.backends: dict[str, backend.BackendBase] = {}
+        self.pending: list[backend.BackendBase] = []
+        self.active = None
+        self.lock = threading.Lock()
+
+    def get(self, label) -> backend.BackendBase:
+        return self.backends.get(label)
+
+    def list_running(self) -> list[backend.BackendBase]:
+        with self.lock:
+            return list(self.backends.values())
+
+    def list_pending(self) -> list[backend.BackendBase]:
+        with self.lock:
+            return list(self.pending)
+
+    def get_serving(self, label) -> backend.BackendBase:
+        """Returns the backend that serves requests for the model: the running one, or, if there is none, the one being started in blue/green mode."""
+
+        with self.lock:
+            bknd = self.backends.get(label)
+            if bknd is not None and not bknd.over:
+                return bknd
+
+            return next((x for x in reversed(self.pending) if x.model.label == label and not x.over), bknd)
+
+    def active_backend(self) -> backend.BackendBase:
+        return self.backends.get(self.active)
+
+    def allocate_port(self, backend_type):
+        used = {str(x.port) for x in [*self.backends.values(), *self.pending]}
+
+        preferred = backend_type.default_port()
+        candidates = ([preferred] if preferred else []) + [str(x) for x in utils.parse_port_range(shared.opts.backend_port_range)]
+
+        for port in candidates:
+            if port not in used and utils.is_port_free(port):
+                return port
+
+        raise Exception(f"No free port available in range {shared.opts.backend_port_range}")
+
+    def make_room(self, model_info: models.ModelInfo, size):
+        budget = shared.opts.memory_budget_gb * 1024 ** 3
+        if not budget:
+            return []
+
+        if size > budget:
+            raise Exception(f"Model {model_info.path} ({size / 1024 ** 3:.1f} GB) does not fit into memory budget ({shared.opts.memory_budget_gb} GB)")
+
+        resident = sorted((x for x in self.backends.values() if not x.over and x.model.label != model_info.label), key=lambda x: x.last_used)
+        used = sum(x.memory_size for x in resident)
+
+        evicted = []
+        while resident and used + size > budget:
+            bknd = resident.pop(0)
+            used -= bknd.memory_size
+            evicted.append(bknd)
+
+        return evicted
+
+    def create(self, model_info: models.ModelInfo, blue_green=False, on_demand=False) -> tuple[backend.BackendBase, list[backend.BackendBase]]:
+        """
+        Prepares a new backend for the model without starting it.
+
+        Normally, the old backend for the model and backends evicted to fit the new one into
+        the memory budget are stopped right away. The new backend takes the old one's place
+        before it's stopped, so that requests for the model wait for the new backend instead
+        of failing. In blue/green mode the old backends keep serving requests; the new backend
+        is kept aside until it's ready and switch() is called, and the backends it replaces are
+        returned. Backends created on demand are stopped when they stay idle.
+        """
+
+        size = model_disk_size(model_info)
+
+        bknd = model_info.backend_type()
+        bknd.model = model_info
+        bknd.memory_size = size
+        bknd.started_on_demand = on_demand
+        bknd.on_process_started = self.save_state
+        bknd.log_paths_in_use = self.log_paths
+
+        with self.lock:
+            replaced = self.make_room(model_info, size)
+
+            previous = self.backends.get(model_info.label)
+            if previous is not None:
+                replaced.insert(0, previous)
+
+            if blue_green:
+                bknd.port = self.allocate_port(model_info.backend_type)
+                self.pending.append(bknd)
+                return bknd, replaced
+
+            discarded = [x for x in self.pending if x.model.label == model_info.label]
+            for x in discarded:
+                self.pending.remove(x)
+
+            for old in replaced:
+                del self.backends[old.model.label]
+
+            self.backends[model_info.label] = bknd
+            self.active = model_info.label
+
+        # requests queued for the old backend of the model retry and wait for the new one
+        if previous is not None:
+            previous.retire()
+
+        for old in [*discarded, *replaced]:
+            old.stop_server()
+
+        if previous is not None and previous.stop_report:
+            bknd.switchover_message = f"Restarted: {previous.stop_report}"
+
+        with self.lock:
+            bknd.port = self.allocate_port(model_info.backend_type)
+
+        self.save_state()
+
+        return bknd, []
+
+    def switch(self, bknd: backend.BackendBase, replaced: list[backend.BackendBase]):
+        """Routes requests to a backend prepared in blue/green mode, then stops the backends it replaces once their requests are drained."""
+
+        with self.lock:
+            self.pending.remove(bknd)
+
+            for old in replaced:
+                if self.backends.get(old.model.label) is old:
+                    del self.backends[old.model.label]
+
+            self.backends[bknd.model.label] = bknd
+            self.active = bknd.model.label
+
+        self.save_state()
+
+        for old in replaced:
+            old.retire()
+
+        for old in replaced:
+            old.stop_server()
+
+    def discard(self, bknd: backend.BackendBase):
+        with self.lock:
+            if bknd in self.pending:
+                self.pending.remove(bknd)
+
+        bknd.stop_server()
+
+    def stop(self, label):
+        with self.lock:
+            bknd = self.backends.pop(label, None)
+            pending = [x for x in self.pending if x.model.label == label]
+
+        for x in pending:
+            self.discard(x)
+
+        if bknd is not None:
+            bknd.stop_server()
+
+        self.save_state()
+
+        return bknd
+
+    def log_paths(self) -> list[str]:
+        """Log files of all backends in the pool, which must not be removed when older logs are pruned."""
+
+        with self.lock:
+            return [x.log_path for x in [*self.backends.values(), *self.pending] if x.log_path]
+
+    def save_state(self):
+        """Records running server processes to the state file so that they can be reattached to after the launcher restarts."""
+
+        with self.lock:
+            backends = [*self.backends.values(), *self.pending]
+            active = self.active
+
+        entries = [x.state() for x in backends if x.server_process is not None and x.server_process.poll() is None]
+
+        try:
+            with open(state_filename + '.tmp', 'w', encoding='utf8') as f:
+                json.dump({"active": active, "backends": entries}, f, indent=4)
+
+            os.replace(state_filename + '.tmp', state_filename)
+        except OSError as e:
+            errors.display(e, 'saving backends state')
+
+    def adopt(self) -> list[backend.BackendBase]:
+        """Reattaches to server processes from the state file that are still running and answer health checks; returns backends ready to run()."""
+
+        if not shared.opts.keep_backends_running:
+            return []
+
+        try:
+            with open(state_filename, 'r', encoding='utf8') as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return []
+
+        adopted = []
+
+        for entry in state.get("backends", []):
+            model_info = models.models.get(entry["label"])
+            if model_info is None or entry["label"] in self.backends or not utils.process_matches(entry["pid"], entry["cmd"]):
+                continue
+
+            bknd = model_info.backend_type()
+            bknd.model = model_info
+            bknd.port = entry["port"]
+
+            if not bknd.probe_health():
+                continue
+
+            bknd.memory_size = model_disk_size(model_info)
+            bknd.adopted_process = backend.AdoptedProcess(entry["pid"])
+            bknd.commandline = shlex.join(entry["cmd"])
+            bknd.log_path = entry["log_path"]
+            bknd.process_started_at = entry["started_at"]
+            bknd.profile_index = entry["profile_index"]
+            bknd.started_on_demand = entry.get("started_on_demand", False)
+            bknd.on_process_started = self.save_state
+            bknd.log_paths_in_use = self.log_paths
+
+            with self.lock:
+                self.backends[model_info.label] = bknd
+
+            adopted.append(bknd)
+            print(f"Reattached to {model_info.label}: pid {entry['pid']}, port {bknd.port}")
+
+        with self.lock:
+            if state.get("active") in self.backends:
+                self.active = state["active"]
+
+        return adopted
+
+    def idle_timeout(self, model_info: models.ModelInfo):
+        value = utils.permodel_value(shared.opts.idle_unload_timeout_permodel, model_info.path, shared.opts.idle_unload_timeout)
+
+        try:
+            return float(value)
+        except ValueError:
+            return shared.opts.idle_unload_timeout
+
+    def unload_idle(self):
+        """Stops backends that were started on demand and have been idle for longer than their timeout; ones started by the user are left running."""
+
+        for bknd in self.list_running():
+            if not bknd.started_on_demand:
+                continue
+
+            ttl = self.idle_timeout(bknd.model)
+            if not bknd.is_idle(ttl):
+                continue
+
+            print(f"Unloading {bknd.model.label}: idle for {time.time() - bknd.last_used:.0f} seconds")
+            self.stop(bknd.model.label)
+
+    def idle_unloader_main(self):
+        while True:
+            time.sleep(5)
+
+            if not shared.opts.lazy_loading:
+                continue
+
+            try:
+                self.unload_idle()
+            except Exception as e:
+                errors.display(e, 'unloading idle models')
+
+    def run_idle_unloader(self):
+        thread = threading.Thread(target=self.idle_unloader_main, daemon=True)
+        thread.start()
+
+    def stop_all(self):
+        for bknd in self.list_running():
+            self.stop(bknd.model.label)
@@ -1,9 +1,11 @@
+import concurrent.futures
 import functools
 import json
 import math
 import os
 import re
 import shlex
+import time
 
 from modules import backend, shared, output_reader_tabbyapi, utils, errors
 
@@ -17,45 +19,69 @@ def typesize(typename):
     return int(m.group(0))
 
 
-def read_metadata_from_safetensors(filename):
-    import json
+header_scan_threads = 16
+
+
+def read_safetensors_header(filename, first_read=64 * 1024):
+    """
+    Returns the header of a safetensors file and the file's size.
+
+    The start of the file is read in one call, which covers the length and the header of most files;
+    a second read is only needed for headers longer than that.
+    """
 
     with open(filename, mode="rb") as file:
-        metadata_len = file.read(8)
-        metadata_len = int.from_bytes(metadata_len, "little")
-        json_start = file.read(2)
+        size = os.fstat(file.fileno()).st_size
+        data = file.read(first_read)
+
+        metadata_len = int.from_bytes(data[:8], "little")
+        json_start = data[8:10]
 
         assert metadata_len > 2 and json_start in (b'{"', b"{'"), f"{filename} is not a safetensors file"
 
-        metadata = {}
-        res = {}
+        if len(data) < 8 + metadata_len:
+            data += file.read(8 + metadata_len - len(data))
 
-        try:
-            json_data = json_start + file.read(metadata_len-2)
-            res = json.loads(json_data)
-            for k, v in res.get("__metadata__", {}).items():
-                metadata[k] = v
-                if isinstance(v, str) and v[0:1] == '{':
-                    try:
-                        metadata[k] = json.loads(v)
-                    except Exception:
-                        pass
-            res["__metadata__"] = metadata
-        except Exception:
-            errors.report(f"Error reading metadata from file: {filename}", exc_info=True)
-
-        return res
+    metadata = {}
+    res = {}
+
+    try:
+        res = json.loads(data[8:8 + metadata_len])
+        for k, v in res.get("__metadata__", {}).items():
+            metadata[k] = v
+            if isinstance(v, str) and v[0:1] == '{':
+                try:
+                    metadata[k] = json.loads(v)
+                except Exception:
+                    pass
+        res["__metadata__"] = metadata
+    except Exception:
+        errors.report(f"Error reading metadata from file: {filename}", exc_info=True)
+
+    return res, size
 
 
 class BackendTabbyapi(backend.BackendBase):
     backend_type = 'tabbyapi'
 
+    @classmethod
+    def default_port(cls):
+        return shared.opts.tabbyapi_port
+
+    @classmethod
+    def default_host(cls):
+        return shared.opts.tabbyapi_host
+
     def cmd(self):
         self.chdir = shared.opts.tabbyapi_path
         return self.prepare_commandline_options()
 
+    def fallback_profiles(self):
+        profiles = utils.permodel_value(shared.opts.tabbyapi_fallback_profiles_permodel, self.model.path, shared.opts.tabbyapi_fallback_profiles)
+        return [x.strip() for x in profiles.split('|') if x.strip()]
+
     def create_server_reader(self):
-        return output_reader_tabbyapi.ReaderTabbyapi(self.server_process.stdout)
+        return output_reader_tabbyapi.ReaderTabbyapi(self.server_output)
 
     def detect_started_line(self, line):
         if "Uvicorn running on" not in line:
@@ -72,6 +98,7 @@ class BackendTabbyapi(backend.BackendBase):
             *([f'<b>{h}</b>'] if h else []),
             *([f'<em>{m.group(1)}: {m.group(2)}</em>'] if m else []),
         ])
+        self.build_version = h or (m.group(2) if m else None)
 
     def read_model_info(self):
         model_dir = self.model.fullpath
@@ -94,31 +121,48 @@ class BackendTabbyapi(backend.BackendBase):
             chat_template = config.get('chat_template')
         self.model_chat_template = chat_template or ''
 
-        tensors_info = {}
+        start = time.time()
+
+        safetensors_files = []
         total_size = 0
 
         for root, _, files in os.walk(model_dir):
             for filename in files:
                 filepath = os.path.join(root, filename)
-                total_size += os.path.getsize(filepath)
 
-                if not filename.endswith('.safetensors'):
-                    continue
+                if filename.endswith('.safetensors'):
+                    safetensors_files.append(filepath)
+                else:
+                    total_size += os.path.getsize(filepath)
 
-                try:
-                    metadata = read_metadata_from_safetensors(filepath)
+        safetensors_files.sort()
+
+        def scan(filepath):
+            try:
+                return read_safetensors_header(filepath)
+            except Exception as e:
+                errors.display(e, full_traceback=True)
+                return {}, os.path.getsize(filepath)
+
+        # headers are read concurrently, which matters for models with many shards on network storage; results come back in the order of files
+        with concurrent.futures.ThreadPoolExecutor(max_workers=header_scan_threads) as executor:
+            headers = list(executor.map(scan, safetensors_files))
+
+        tensors_info = {}
+        for metadata, size in headers:
+            total_size += size
+
+            for key, v in metadata.items():
+                dims = v.get('shape', ())
+                dtype_str = v.get('dtype', '')
 
-                    for key, v in metadata.items():
-                        dims = v.get('shape', ())
-                        dtype_str = v.get('dtype', '')
+                if dims and dtype_str:
+                    tensors_info[key] = {
+                        'type': dtype_str,
+                        'dimensions': dims
+                    }
 
-                        if dims and dtype_str:
-                            tensors_info[key] = {
-                                'type': dtype_str,
-                                'dimensions': dims
-                            }
-                except Exception as e:
-                    errors.display(e, full_traceback=True)
+        self.timings['scanning safetensors headers'] = time.time() - start
 
         try:
             tensors_info = self.repack_quantization_layers(tensors_info)
@@ -201,12 +245,10 @@ class BackendTabbyapi(backend.BackendBase):
         return repacked_tensors_info
 
     def prepare_commandline_options(self):
-        model_name = self.model.path
-        model_path = os.path.join(self.model.model_dir, self.model.path)
-        model_alias = os.path.splitext(os.path.basename(model_path))[0]
+        model_path = self.model.fullpath
+        model_alias = self.model.alias
 
-        permodel_opts_all = [x.partition(':') for x in shared.opts.tabbyapi_cmdline_permodel.split('\n')]
-        permodel_opts = next((opts for model, _, opts in permodel_opts_all if model and model.lower() in model_name.lower()), '')
+        permodel_opts = utils.permodel_value(shared.opts.tabbyapi_cmdline_permodel, self.model.path)
 
         python_paths = [
             os.path.join(shared.opts.tabbyapi_path, "venv", "scripts", "python.exe"),
@@ -222,10 +264,10 @@ class BackendTabbyapi(backend.BackendBase):
             os.path.join(shared.opts.tabbyapi_path, "start.py"),
             "--model-name", model_path,
             "--dummy-model-names", model_alias
-        ] + shlex.split(permodel_opts.strip()) + shlex.split(shared.opts.tabbyapi_cmdline.strip())
+        ] + shlex.split(permodel_opts) + shlex.split(shared.opts.tabbyapi_cmdline.strip())
 
-        if shared.opts.tabbyapi_port:
-            cmd += ["--port", shared.opts.tabbyapi_port]
+        if self.port:
+            cmd += ["--port", str(self.port)]
 
         if shared.opts.tabbyapi_host:
             cmd += ["--host", shared.opts.tabbyapi_host]
@@ -0,0 +1,113 @@
+import dataclasses
+import re
+import time
+
+import requests
+
+from modules import shared
+
+
+re_metric = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{[^}]*\})?\s+(\S+)')
+
+
+def parse_metrics(text) -> dict[str, float]:
+    """Parses unlabeled samples from Prometheus text format into a dict of name to value."""
+
+    res = {}
+
+    for line in text.splitlines():
+        m = re_metric.match(line)
+        if not m:
+            continue
+
+        try:
+            res[m.group(1)] = float(m.group(2))
+        except ValueError:
+            pass
+
+    return res
+
+
+@dataclasses.dataclass
+class SlotStats:
+    id: int
+    processing: bool = False
+    task_id: int = None
+    n_ctx: int = None
+    n_decoded: int = None
+
+
+@dataclasses.dataclass
+class ServerStats:
+    time: float = 0
+    slots: list[SlotStats] = dataclasses.field(default_factory=list)
+    requests_processing: int = None
+    requests_deferred: int = None
+    kv_cache_usage: float = None
+    kv_cache_tokens: int = None
+    prompt_tokens_total: int = None
+    tokens_predicted_total: int = None
+
+    def busy_slots(self):
+        return sum(1 for x in self.slots if x.processing)
+
+
+class CollectorLlamacpp:
+    """
+    Polls llama-server's /metrics and /slots endpoints for what it doesn't write to its output:
+    busy slots, queued (deferred) requests and KV cache usage.
+
+    /metrics only answers if the server was started with --metrics, and /slots can be disabled with --no-slots;
+    the stats from an endpoint that doesn't answer are left as None.
+    """
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    def get(self, path):
+        try:
+            response = requests.get(self.base_url + path, timeout=shared.opts.health_probe_timeout)
+        except requests.RequestException:
+            return None
+
+        return response if response.status_code == 200 else None
+
+    def collect(self) -> ServerStats:
+        stats = ServerStats(time=time.time())
+
+        response = self.get('/metrics')
+        if response is not None:
+            metrics = parse_metrics(response.text)
+
+            def metric(name, kind=int):
+                value = metrics.get(f'llamacpp:{name}')
+                return None if value is None else kind(value)
+
+            stats.requests_processing = metric('requests_processing')
+            stats.requests_deferred = metric('requests_deferred')
+            stats.kv_cache_usage = metric('kv_cache_usage_ratio', float)
+            stats.kv_cache_tokens = metric('kv_cache_tokens')
+            stats.prompt_tokens_total = metric('prompt_tokens_total')
+            stats.tokens_predicted_total = metric('tokens_predicted_total')
+
+        response = self.get('/slots')
+        if response is not None:
+            try:
+                slots = response.json()
+            except ValueError:
+                slots = []
+
+            for slot in slots if isinstance(slots, list) else []:
+                next_token = slot.get('next_token') or {}
+                if isinstance(next_token, list):
+                    next_token = next_token[0] if next_token else {}
+
+                stats.slots.append(SlotStats(
+                    id=slot.get('id'),
+                    processing=bool(slot.get('is_processing', slot.get('state', 0))),
+                    task_id=slot.get('id_task'),
+                    n_ctx=slot.get('n_ctx'),
+                    n_decoded=next_token.get('n_decoded'),
+                ))
+
+        return stats
@@ -0,0 +1,301 @@
+import collections.abc
+import mmap
+import struct
+import sys
+import time
+
+TENSOR_TYPES = {
+    0: 'F32',
+    1: 'F16',
+    2: 'Q4_0',
+    3: 'Q4_1',
+    6: 'Q5_0',
+    7: 'Q5_1',
+    8: 'Q8_0',
+    9: 'Q8_1',
+    10: 'Q2_K',
+    11: 'Q3_K',
+    12: 'Q4_K',
+    13: 'Q5_K',
+    14: 'Q6_K',
+    15: 'Q8_K',
+    16: 'IQ2_XXS',
+    17: 'IQ2_XS',
+    18: 'IQ3_XXS',
+    19: 'IQ1_S',
+    20: 'IQ4_NL',
+    21: 'IQ3_S',
+    22: 'IQ2_S',
+    23: 'IQ4_XS',
+    24: 'I8',
+    25: 'I16',
+    26: 'I32',
+    27: 'I64',
+    28: 'F64',
+    29: 'IQ1_M',
+    30: 'BF16',
+    34: 'TQ1_0',
+    35: 'TQ2_0',
+    39: 'MXFP4',
+}
+
+type_string = 8
+type_array = 9
+
+scalar_formats = {
+    0: struct.Struct('<B'),
+    1: struct.Struct('<b'),
+    2: struct.Struct('<H'),
+    3: struct.Struct('<h'),
+    4: struct.Struct('<I'),
+    5: struct.Struct('<i'),
+    6: struct.Struct('<f'),
+    7: struct.Struct('<?'),
+    10: struct.Struct('<Q'),
+    11: struct.Struct('<q'),
+    12: struct.Struct('<d'),
+}
+
+u32 = struct.Struct('<I')
+u64 = struct.Struct('<Q')
+
+
+class GgufArray(collections.abc.Sequence):
+    """Array value from GGUF metadata; elements are decoded from the mapped file when accessed."""
+
+    def __init__(self, data, item_type, count, start):
+        self.data = data
+        self.item_type = item_type
+        self.count = count
+        self.start = start
+        self.string_offsets = None
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.count))]
+
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+
+        if self.item_type == type_string:
+            # strings have different lengths, so offsets of elements are found by walking the array up to the element
+            offsets = self.string_offsets
+            if offsets is None:
+                offsets = self.string_offsets = [self.start]
+
+            while len(offsets) <= index:
+                last = offsets[-1]
+                offsets.append(last + 8 + u64.unpack_from(self.data, last)[0])
+
+            return read_string(self.data, offsets[index])[0]
+
+        if self.item_type == type_array:
+            # nested arrays are rare and don't have fixed-size elements; walk to the element
+            offset = self.start
+            for _ in range(index):
+                offset = skip_value(self.data, type_array, offset)
+
+            return read_value(self.data, type_array, offset)
+
+        fmt = scalar_formats[self.item_type]
+        return fmt.unpack_from(self.data, self.start + index * fmt.size)[0]
+
+
+def skip_value(data, value_type, offset):
+    """Returns offset right after the value of value_type that starts at offset, without decoding it."""
+
+    fmt = scalar_formats.get(value_type)
+    if fmt is not None:
+        return offset + fmt.size
+
+    if value_type == type_string:
+        return offset + 8 + u64.unpack_from(data, offset)[0]
+
+    if value_type == type_array:
+        item_type = u32.unpack_from(data, offset)[0]
+        count = u64.unpack_from(data, offset + 4)[0]
+        offset += 12
+
+        fmt = scalar_formats.get(item_type)
+        if fmt is not None:
+            return offset + count * fmt.size
+
+        if item_type == type_string:
+            unpack_from = u64.unpack_from
+            for _ in range(count):
+                offset += 8 + unpack_from(data, offset)[0]
+
+            return offset
+
+        for _ in range(count):
+            offset = skip_value(data, item_type, offset)
+
+        return offset
+
+    raise ValueError(f'unknown GGUF value type {value_type} at offset {offset}')
+
+
+def read_string(data, offset):
+    """Returns the string at offset and offset right after it."""
+
+    length = u64.unpack_from(data, offset)[0]
+    return bytes(data[offset + 8:offset + 8 + length]).decode('utf8', errors='replace'), offset + 8 + length
+
+
+def read_value(data, value_type, offset):
+    """Decodes the value of value_type at offset; arrays are returned as GgufArray without decoding elements."""
+
+    fmt = scalar_formats.get(value_type)
+    if fmt is not None:
+        return fmt.unpack_from(data, offset)[0]
+
+    if value_type == type_string:
+        return read_string(data, offset)[0]
+
+    if value_type == type_array:
+        item_type = u32.unpack_from(data, offset)[0]
+        count = u64.unpack_from(data, offset + 4)[0]
+        return GgufArray(data, item_type, count, offset + 12)
+
+    raise ValueError(f'unknown GGUF value type {value_type} at offset {offset}')
+
+
+class GgufMetadata(collections.abc.Mapping):
+    """GGUF metadata key-value pairs; the file is indexed once, and each value is decoded when it's looked up."""
+
+    def __init__(self, data, index: dict[str, tuple[int, int]]):
+        self.data = data
+        self.index = index
+        self.values = {}
+
+    def __getitem__(self, key):
+        if key not in self.values:
+            value_type, offset = self.index[key]
+            self.values[key] = read_value(self.data, value_type, offset)
+
+        return self.values[key]
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+
+class GgufReader:
+    """
+    Reads metadata and tensor descriptors from the header of a GGUF file.
+
+    The file is memory-mapped, and only offsets of metadata values are recorded when the header is read;
+    large arrays like the tokenizer's token list and merges are skipped over without being decoded, and
+    metadata values are decoded on access. Values must be accessed before the reader is closed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise ValueError(f"{path} is empty")
+
+        try:
+            self.read_header()
+        except Exception:
+            self.close()
+            raise
+
+    def read_header(self):
+        data = self.data
+
+        if data[:4] != b'GGUF':
+            raise ValueError(f"{self.path} is not a GGUF file")
+
+        self.version = u32.unpack_from(data, 4)[0]
+        if self.version == 1:
+            raise ValueError(f"{self.path} uses GGUF version 1, which is not supported")
+
+        tensor_count, kv_count = struct.unpack_from('<QQ', data, 8)
+        offset = 24
+
+        index = {}
+        for _ in range(kv_count):
+            key, offset = read_string(data, offset)
+            value_type = u32.unpack_from(data, offset)[0]
+            index[key] = (value_type, offset + 4)
+            offset = skip_value(data, value_type, offset + 4)
+
+        self.metadata = GgufMetadata(data, index)
+
+        self.tensors_info = []
+        for _ in range(tensor_count):
+            name, offset = read_string(data, offset)
+            n_dimensions = u32.unpack_from(data, offset)[0]
+            dimensions = struct.unpack_from(f'<{n_dimensions}Q', data, offset + 4)
+            offset += 4 + 8 * n_dimensions
+
+            tensor_type, tensor_offset = struct.unpack_from('<IQ', data, offset)
+            offset += 12
+
+            self.tensors_info.append({"name": name, "dimensions": list(dimensions), "type": tensor_type, "offset": tensor_offset})
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def benchmark(path, repeat=5):
+    """Compares time to read the fields the llama.cpp backend uses with this reader and with the gguf_parser package."""
+
+    def with_reader():
+        with GgufReader(path) as reader:
+            tokens = reader.metadata.get('tokenizer.ggml.tokens', [])
+            special = [reader.metadata.get(f'tokenizer.ggml.{x}_token_id', -1) for x in ['bos', 'eos', 'unknown', 'padding']]
+            [tokens[x] for x in special if 0 <= x < len(tokens)]
+            reader.metadata.get('tokenizer.chat_template')
+            return len(reader.tensors_info)
+
+    def with_gguf_parser():
+        import gguf_parser
+
+        parser = gguf_parser.GGUFParser(path)
+        parser.parse()
+        tokens = parser.metadata.get('tokenizer.ggml.tokens', [])
+        special = [parser.metadata.get(f'tokenizer.ggml.{x}_token_id', -1) for x in ['bos', 'eos', 'unknown', 'padding']]
+        [tokens[x] for x in special if 0 <= x < len(tokens)]
+        parser.metadata.get('tokenizer.chat_template')
+        return len(parser.tensors_info)
+
+    for name, func in [("GgufReader", with_reader), ("gguf_parser", with_gguf_parser)]:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            try:
+                tensors = func()
+            except ImportError:
+                print(f"{name}: not installed")
+                break
+
+            times.append(time.perf_counter() - start)
+        else:
+            print(f"{name}: {tensors} tensors, best {min(times) * 1000:.1f} ms, median {sorted(times)[len(times) // 2] * 1000:.1f} ms of {repeat} runs")
+
+
+if __name__ == '__main__':
+    # python -m modules.gguf_reader model.gguf [model2.gguf ...]
+    for filename in sys.argv[1:]:
+        print(filename)
+        benchmark(filename)
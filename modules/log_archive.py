@@ -0,0 +1,108 @@
+import dataclasses
+import mmap
+import os
+import re
+import time
+
+from modules import shared, errors
+
+logs_dir = os.path.join(shared.script_path, 'logs')
+
+
+@dataclasses.dataclass
+class SearchResult:
+    path: str
+    alias: str
+    line: str
+
+
+def new_log_path(alias, port):
+    """Returns path for the log file of a new run of the model's server; each model has its own directory of logs, one file per run."""
+
+    return os.path.join(logs_dir, alias, f"{time.strftime('%Y%m%d-%H%M%S')}-{port}.log")
+
+
+def rotated_path(path):
+    """Returns path for the older part of a log that was rotated while its server was running."""
+
+    return path + '.1'
+
+
+def list_logs(alias=None) -> list[str]:
+    """Returns paths of log files for the model, or for all models, newest first."""
+
+    if not os.path.isdir(logs_dir):
+        return []
+
+    aliases = [alias] if alias else os.listdir(logs_dir)
+
+    paths = []
+    for name in aliases:
+        directory = os.path.join(logs_dir, name)
+        if os.path.isdir(directory):
+            paths += [os.path.join(directory, x) for x in os.listdir(directory) if x.endswith('.log')]
+
+    return sorted(paths, key=os.path.getmtime, reverse=True)
+
+
+def prune(alias, keep, in_use=()):
+    """Deletes log files of the model's older runs, keeping the newest `keep` ones and files of servers that are still running."""
+
+    in_use = {os.path.abspath(x) for x in in_use if x}
+
+    for path in list_logs(alias)[max(int(keep), 1):]:
+        if os.path.abspath(path) in in_use:
+            continue
+
+        for filename in [path, rotated_path(path)]:
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                errors.display(e, f'removing old log {filename}')
+
+
+def search(query, alias=None, max_results=200, ignore_case=True) -> list[SearchResult]:
+    """
+    Finds lines containing the query in log files of past and current runs, newest files first, including rotated parts.
+
+    Files are memory-mapped and scanned with a compiled regular expression, so only matching lines are decoded.
+    """
+
+    if not query:
+        return []
+
+    pattern = re.compile(re.escape(query.encode('utf8')), re.IGNORECASE if ignore_case else 0)
+    results = []
+
+    for path in (x for log in list_logs(alias) for x in [log, rotated_path(log)] if os.path.exists(x)):
+        try:
+            with open(path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    continue
+
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    position = 0
+
+                    while len(results) < max_results:
+                        m = pattern.search(data, position)
+                        if not m:
+                            break
+
+                        line_start = data.rfind(b'\n', 0, m.start()) + 1
+                        line_end = data.find(b'\n', m.end())
+                        if line_end == -1:
+                            line_end = len(data)
+
+                        line = data[line_start:line_end].decode('utf8', errors='replace').rstrip('\r')
+                        results.append(SearchResult(path=path, alias=os.path.basename(os.path.dirname(path)), line=line))
+
+                        position = line_end + 1
+        except (OSError, ValueError) as e:
+            errors.display(e, f'searching log {path}')
+
+        if len(results) >= max_results:
+            break
+
+    return results
@@ -0,0 +1,148 @@
+import os
+
+from modules import backend, request_stats, telemetry
+
+content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+latency_buckets = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300]
+token_latency_buckets = [0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1]
+
+
+def process_rss():
+    """Resident memory of the launcher process in bytes, or None if it can't be read."""
+
+    try:
+        with open('/proc/self/statm', 'r', encoding='utf8') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsWriter:
+    """Builds a response in Prometheus text exposition format, keeping samples of each metric together."""
+
+    def __init__(self):
+        self.families = {}
+
+    def describe(self, name, kind, help_text):
+        if name not in self.families:
+            self.families[name] = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+
+        return self.families[name]
+
+    def sample(self, family, name, labels, value):
+        if value is None:
+            return
+
+        label_text = ",".join(f'{k}="{escape_label(v)}"' for k, v in labels.items())
+        value_text = str(value) if isinstance(value, int) else repr(float(value))
+        family.append(f"{name}{{{label_text}}} {value_text}" if label_text else f"{name} {value_text}")
+
+    def add(self, name, kind, help_text, labels, value):
+        self.sample(self.describe(name, kind, help_text), name, labels, value)
+
+    def histogram(self, name, help_text, labels, sketch: request_stats.QuantileSketch, buckets):
+        """Adds a histogram in seconds from a quantile sketch of values in milliseconds."""
+
+        family = self.describe(name, 'histogram', help_text)
+
+        for bound in buckets:
+            self.sample(family, f"{name}_bucket", {**labels, "le": f"{bound:g}"}, sketch.count_at_most(bound * 1000))
+
+        self.sample(family, f"{name}_bucket", {**labels, "le": "+Inf"}, sketch.count)
+        self.sample(family, f"{name}_sum", labels, sketch.sum / 1000)
+        self.sample(family, f"{name}_count", labels, sketch.count)
+
+    def text(self):
+        return "".join(line + "\n" for family in self.families.values() for line in family)
+
+
+def backend_metrics(writer: MetricsWriter, bknd: backend.BackendBase):
+    labels = {"model": bknd.model.path, "backend_type": bknd.backend_type}
+
+    writer.add("llm_launcher_backend_ready", "gauge", "Whether the backend is accepting requests.", labels, int(bknd.ready and not bknd.over))
+    writer.add("llm_launcher_backend_uptime_seconds", "gauge", "Time since the backend's server process started.", labels, bknd.uptime() or 0)
+    writer.add("llm_launcher_backend_restarts_total", "counter", "Restarts of the backend after its server process exited.", labels, bknd.restart_count)
+    writer.add("llm_launcher_backend_active_requests", "gauge", "Requests being processed by the backend through the proxy.", labels, bknd.active_requests)
+    writer.add("llm_launcher_backend_queued_requests", "gauge", "Requests waiting in the proxy for the backend.", labels, bknd.queued_requests)
+    writer.add("llm_launcher_backend_health_latency_seconds", "gauge", "Latency of the last successful health check.", labels, bknd.probe_latency / 1000 if bknd.probe_latency is not None else None)
+
+    sample, rates = telemetry.sampler.latest_process(bknd.model.label)
+    if sample is not None:
+        writer.add("llm_launcher_backend_resident_memory_bytes", "gauge", "Resident memory of the backend's server process.", labels, sample.rss)
+        writer.add("llm_launcher_backend_gpu_memory_bytes", "gauge", "GPU memory used by the backend's server process.", labels, sample.gpu_memory)
+        writer.add("llm_launcher_backend_cpu_seconds_total", "counter", "CPU time used by the backend's server process.", labels, sample.cpu_time)
+        writer.add("llm_launcher_backend_major_faults_total", "counter", "Major page faults of the backend's server process.", labels, sample.major_faults)
+        writer.add("llm_launcher_backend_read_bytes_total", "counter", "Bytes read from storage by the backend's server process.", labels, sample.read_bytes)
+        writer.add("llm_launcher_backend_write_bytes_total", "counter", "Bytes written to storage by the backend's server process.", labels, sample.write_bytes)
+
+    server_stats = bknd.server_stats
+    if server_stats is not None:
+        if server_stats.slots:
+            writer.add("llm_launcher_server_slots", "gauge", "Slots reported by the server.", labels, len(server_stats.slots))
+            writer.add("llm_launcher_server_busy_slots", "gauge", "Slots processing a request, as reported by the server.", labels, server_stats.busy_slots())
+
+        writer.add("llm_launcher_server_processing_requests", "gauge", "Requests being processed inside the server.", labels, server_stats.requests_processing)
+        writer.add("llm_launcher_server_deferred_requests", "gauge", "Requests waiting for a free slot inside the server.", labels, server_stats.requests_deferred)
+        writer.add("llm_launcher_server_kv_cache_usage_ratio", "gauge", "Fraction of the KV cache in use.", labels, server_stats.kv_cache_usage)
+        writer.add("llm_launcher_server_kv_cache_tokens", "gauge", "Tokens in the KV cache.", labels, server_stats.kv_cache_tokens)
+        writer.add("llm_launcher_server_prompt_tokens_total", "counter", "Prompt tokens processed, as reported by the server.", labels, server_stats.prompt_tokens_total)
+        writer.add("llm_launcher_server_generated_tokens_total", "counter", "Tokens generated, as reported by the server.", labels, server_stats.tokens_predicted_total)
+
+    if bknd.server_reader is None:
+        return
+
+    total, latency = bknd.server_reader.stats.totals()
+
+    writer.add("llm_launcher_requests_total", "counter", "Requests completed by the server since it started.", labels, total.requests)
+    writer.add("llm_launcher_prompt_tokens_total", "counter", "Prompt tokens processed by the server since it started.", labels, total.tokens_process)
+    writer.add("llm_launcher_generated_tokens_total", "counter", "Tokens generated by the server since it started.", labels, total.tokens_generate)
+    writer.add("llm_launcher_cached_prompt_tokens_total", "counter", "Prompt tokens reused from the cache since the server started.", labels, total.tokens_cached)
+    writer.add("llm_launcher_log_lines_dropped_total", "counter", "Server output lines dropped because a reader fell behind.", labels, bknd.server_reader.bus.dropped)
+
+    for slot in bknd.server_reader.list_slots():
+        writer.add("llm_launcher_slot_requests_total", "counter", "Requests completed by a slot since the server started.", {**labels, "slot": slot.id}, slot.requests)
+
+    writer.histogram("llm_launcher_prompt_seconds", "Time spent processing the prompt of a request.", labels, latency.time_process, latency_buckets)
+    writer.histogram("llm_launcher_generation_seconds", "Time spent generating tokens for a request.", labels, latency.time_generate, latency_buckets)
+    writer.histogram("llm_launcher_token_seconds", "Time spent generating one token, averaged over a request.", labels, latency.time_per_token, token_latency_buckets)
+
+
+def render(launcher):
+    """Returns metrics for all backends and the launcher itself in Prometheus text format."""
+
+    writer = MetricsWriter()
+
+    for bknd in launcher.pool.list_running():
+        backend_metrics(writer, bknd)
+
+    writer.add("llm_launcher_download_bytes_total", "counter", "Bytes received by model downloads.", {}, launcher.downloader.total_bytes_downloaded())
+    writer.add("llm_launcher_resident_memory_bytes", "gauge", "Resident memory of the launcher process.", {}, process_rss())
+
+    host = telemetry.sampler.latest_host()
+    if host is not None:
+        writer.add("llm_launcher_host_memory_available_bytes", "gauge", "Memory available on the host.", {}, host.memory_available)
+
+        for resource, value in host.pressure.items():
+            writer.add("llm_launcher_host_pressure_ratio", "gauge", "Share of time some tasks were stalled on a resource over the last 10 seconds.", {"resource": resource}, value / 100)
+
+        for gpu in host.gpus:
+            writer.add("llm_launcher_gpu_memory_used_bytes", "gauge", "Memory used on a GPU.", {"gpu": gpu.index, "name": gpu.name}, gpu.memory_used)
+            writer.add("llm_launcher_gpu_utilization_ratio", "gauge", "Share of time a GPU was busy.", {"gpu": gpu.index, "name": gpu.name}, gpu.utilization / 100 if gpu.utilization is not None else None)
+
+    return writer.text()
+
+
+def add_route(app, launcher):
+    """Serves metrics at /metrics of the web UI's FastAPI app."""
+
+    from fastapi.responses import Response
+
+    def get_metrics():
+        return Response(content=render(launcher), media_type=content_type)
+
+    app.add_api_route("/metrics", get_metrics, methods=["GET"])
@@ -0,0 +1,331 @@
+import concurrent.futures
+import ctypes
+import ctypes.util
+import dataclasses
+import os
+import struct
+import sys
+import threading
+
+from modules import shared, errors
+
+kind_gguf = 'gguf'
+kind_directory = 'directory'
+
+
+@dataclasses.dataclass
+class DirectoryState:
+    root: str
+    mtime_ns: int
+    files: list[str]
+    dirs: list[str]
+
+
+def scan_tree(root, path, known: dict[str, DirectoryState], watch=None) -> dict[str, DirectoryState]:
+    """
+    Returns state of path and all directories under it.
+
+    A directory's mtime changes when entries are added to it, removed or renamed, so directories whose
+    mtime is the same as in known are not listed again; only their subdirectories are visited. If watch
+    is given, it's called for every directory that is listed, before listing it, so that no changes are
+    missed between listing and watching.
+
+    Symlinks to directories are followed, but a directory reached again through a symlink is skipped, so that
+    links pointing at their own parent directories don't make the scan go on forever.
+    """
+
+    res = {}
+    stack = [path]
+    visited = set()
+
+    while stack:
+        directory = stack.pop()
+
+        try:
+            stat = os.stat(directory)
+        except OSError:
+            continue
+
+        if (stat.st_dev, stat.st_ino) in visited:
+            continue
+
+        visited.add((stat.st_dev, stat.st_ino))
+        mtime_ns = stat.st_mtime_ns
+
+        state = known.get(directory)
+        if state is None or state.mtime_ns != mtime_ns or state.root != root:
+            if watch is not None:
+                watch(directory)
+
+            files, dirs = [], []
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        try:
+                            (dirs if entry.is_dir() else files).append(entry.name)
+                        except OSError:
+                            pass
+            except OSError:
+                continue
+
+            state = DirectoryState(root=root, mtime_ns=mtime_ns, files=sorted(files), dirs=sorted(dirs))
+
+        res[directory] = state
+        stack += [os.path.join(directory, x) for x in state.dirs]
+
+    return res
+
+
+class Inotify:
+    """Minimal inotify binding over libc; watches directories for entries being added, removed or renamed."""
+
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_MOVE_SELF = 0x800
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ONLYDIR = 0x1000000
+    IN_CLOEXEC = 0o2000000
+
+    mask = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+
+    event_header = struct.Struct('iIII')
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        self.watches: dict[str, int] = {}
+        self.paths: dict[int, str] = {}
+        self.lock = threading.Lock()
+
+    def add_watch(self, path):
+        with self.lock:
+            if path in self.watches:
+                return
+
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.mask)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f'inotify_add_watch failed for {path}')
+
+            self.watches[path] = wd
+            self.paths[wd] = path
+
+    def remove_watch(self, path):
+        with self.lock:
+            wd = self.watches.pop(path, None)
+            if wd is None:
+                return
+
+            self.paths.pop(wd, None)
+            self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self) -> tuple[set[str], bool]:
+        """Waits for events; returns directories whose entries changed and whether the kernel's event queue overflowed."""
+
+        data = os.read(self.fd, 64 * 1024)
+        changed = set()
+        overflow = False
+        offset = 0
+
+        while offset + self.event_header.size <= len(data):
+            wd, mask, _, length = self.event_header.unpack_from(data, offset)
+            offset += self.event_header.size + length
+
+            if mask & self.IN_Q_OVERFLOW:
+                overflow = True
+                continue
+
+            with self.lock:
+                path = self.paths.get(wd)
+                if mask & self.IN_IGNORED and path is not None:
+                    self.paths.pop(wd, None)
+                    self.watches.pop(path, None)
+
+            if path is None:
+                continue
+
+            # a removed or moved directory is rescanned from its parent, which also gets an event
+            changed.add(os.path.dirname(path) if mask & (self.IN_DELETE_SELF | self.IN_MOVE_SELF) else path)
+
+        return changed, overflow
+
+
+class ModelIndex:
+    """
+    Files and directories under the model directories, kept in memory and updated incrementally.
+
+    Roots are scanned in parallel the first time they are needed. After that, on Linux, every directory
+    is watched with inotify, and only the directories that got events are listed again. A periodic
+    reconciliation, which only stats directories and lists the ones with a changed mtime, catches
+    changes inotify doesn't see, like ones made on network storage by other machines, and is all there
+    is on other systems.
+    """
+
+    def __init__(self):
+        self.roots: list[str] = []
+        self.directories: dict[str, DirectoryState] = {}
+        self.version = 0
+        self.entries_cache = (None, [])
+        self.lock = threading.Lock()
+        self.update_lock = threading.Lock()
+        self.inotify = None
+        self.started = False
+        self.reconcile_requested = threading.Event()
+        self.reconcile_waiters: list[threading.Event] = []
+
+    def start(self):
+        if self.started:
+            return
+
+        self.started = True
+
+        try:
+            self.inotify = Inotify() if sys.platform.startswith('linux') else None
+        except Exception as e:
+            errors.display_once(e, 'watching model directories for changes; changes will be picked up by periodic checks')
+            self.inotify = None
+
+        if self.inotify is not None:
+            threading.Thread(target=self.watcher_main, daemon=True).start()
+
+        threading.Thread(target=self.reconciler_main, daemon=True).start()
+
+    def watch(self, path):
+        try:
+            self.inotify.add_watch(path)
+        except OSError as e:
+            errors.display_once(e, 'watching model directories for changes; changes will be picked up by periodic checks')
+
+    def update(self, tree_roots: dict[str, str]):
+        """Rescans every directory in tree_roots, which maps a directory to its model root, along with all directories under it."""
+
+        with self.update_lock:
+            known = self.directories
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max(min(len(tree_roots), 8), 1)) as executor:
+                watch = self.watch if self.inotify is not None else None
+                results = list(executor.map(lambda x: scan_tree(x[1], x[0], known, watch), tree_roots.items()))
+
+            directories = dict(known)
+            for path in tree_roots:
+                prefix = os.path.join(path, '')
+                for removed in [x for x in directories if x == path or x.startswith(prefix)]:
+                    del directories[removed]
+
+            for result in results:
+                directories.update(result)
+
+            if self.inotify is not None:
+                for removed in known.keys() - directories.keys():
+                    self.inotify.remove_watch(removed)
+
+            changed = directories.keys() != known.keys() or any(known.get(x) is not y for x, y in directories.items())
+
+            with self.lock:
+                self.directories = directories
+                if changed:
+                    self.version += 1
+
+    def set_roots(self, roots: list[str]):
+        """Makes the index cover these directories, scanning ones it doesn't have yet."""
+
+        self.start()
+
+        if roots == self.roots:
+            return
+
+        with self.update_lock:
+            old_roots, self.roots = self.roots, list(roots)
+
+            with self.lock:
+                self.directories = {x: y for x, y in self.directories.items() if y.root in roots}
+                self.version += 1
+
+        new_roots = [x for x in roots if x not in old_roots]
+        if new_roots:
+            self.update({x: x for x in new_roots})
+
+    def reconcile(self):
+        self.update({x: x for x in self.roots})
+
+    def request_reconcile(self, timeout=None):
+        """Wakes up the reconciliation thread and waits up to timeout for it to finish."""
+
+        done = threading.Event()
+        with self.lock:
+            self.reconcile_waiters.append(done)
+
+        self.reconcile_requested.set()
+        done.wait(timeout)
+
+    def reconciler_main(self):
+        while True:
+            interval = shared.opts.model_index_interval
+            self.reconcile_requested.wait(interval if interval > 0 else None)
+            self.reconcile_requested.clear()
+
+            with self.lock:
+                waiters, self.reconcile_waiters = self.reconcile_waiters, []
+
+            try:
+                self.reconcile()
+            except Exception as e:
+                errors.display_once(e, 'checking model directories for changes')
+
+            for done in waiters:
+                done.set()
+
+    def watcher_main(self):
+        while True:
+            try:
+                changed, overflow = self.inotify.read()
+
+                if overflow:
+                    self.reconcile()
+                    continue
+
+                tree_roots = {}
+                for path in changed:
+                    state = self.directories.get(path)
+                    if state is not None:
+                        tree_roots[path] = state.root
+
+                if tree_roots:
+                    self.update(tree_roots)
+            except Exception as e:
+                errors.display_once(e, 'updating model index from inotify events')
+
+    def list_entries(self) -> list[tuple[str, str, str]]:
+        """Returns (root, path relative to root, kind) for every GGUF file and every directory with model configs, in order of roots."""
+
+        with self.lock:
+            version, entries = self.entries_cache
+            if version == self.version:
+                return entries
+
+            version, directories, roots = self.version, self.directories, self.roots
+
+        entries = []
+        for directory, state in directories.items():
+            for filename in state.files:
+                if filename.endswith('.gguf'):
+                    entries.append((state.root, os.path.relpath(os.path.join(directory, filename), state.root), kind_gguf))
+
+            if directory != state.root and 'config.json' in state.files and 'tokenizer_config.json' in state.files:
+                entries.append((state.root, os.path.relpath(directory, state.root), kind_directory))
+
+        entries.sort(key=lambda x: (roots.index(x[0]) if x[0] in roots else len(roots), x[1]))
+
+        with self.lock:
+            self.entries_cache = (version, entries)
+
+        return entries
+
+
+index = ModelIndex()
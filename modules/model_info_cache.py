@@ -0,0 +1,86 @@
+import json
+import os
+import threading
+
+from modules import shared, errors
+
+cache_filename = os.path.join(shared.script_path, 'model_info.json')
+
+# increase when the fields backends read from model files change, to make old entries invalid
+cache_version = 2
+
+
+def files_signature(path):
+    """Returns sizes and modification times of the model's file, or of all files in the model's directory; the entry is valid as long as this stays the same."""
+
+    if os.path.isfile(path):
+        stat = os.stat(path)
+        return [['', stat.st_size, stat.st_mtime_ns]]
+
+    res = []
+    for root, _, files in os.walk(path):
+        for filename in files:
+            filepath = os.path.join(root, filename)
+            stat = os.stat(filepath)
+            res.append([os.path.relpath(filepath, path), stat.st_size, stat.st_mtime_ns])
+
+    return sorted(res)
+
+
+class ModelInfoCache:
+    """
+    Model metadata read by backends (architecture, chat template, special tokens, tensor table, size, parameter count),
+    stored in a JSON file keyed by the model's path.
+
+    An entry is used only if sizes and modification times of the model's files are the same as when it was
+    written, so that a model that was replaced or re-downloaded is read again.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.entries = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        if self.entries is not None:
+            return
+
+        try:
+            with open(self.filename, 'r', encoding='utf8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            data = {}
+
+        self.entries = data.get('models', {}) if data.get('version') == cache_version else {}
+
+    def save(self):
+        self.entries = {path: entry for path, entry in self.entries.items() if os.path.exists(path)}
+
+        try:
+            with open(self.filename + '.tmp', 'w', encoding='utf8') as f:
+                json.dump({"version": cache_version, "models": self.entries}, f)
+
+            os.replace(self.filename + '.tmp', self.filename)
+        except OSError as e:
+            errors.display(e, 'saving model info cache')
+
+    def get(self, path, signature) -> dict:
+        """Returns stored metadata for the model, or None if there is none or it was stored for files with a different signature."""
+
+        with self.lock:
+            self.load()
+            entry = self.entries.get(path)
+
+        if entry is None or entry['signature'] != signature:
+            return None
+
+        return entry['data']
+
+    def put(self, path, data, signature):
+        with self.lock:
+            self.load()
+            self.entries[path] = {"signature": signature, "data": data}
+            self.save()
+
+
+cache = ModelInfoCache(cache_filename)
@@ -3,7 +3,7 @@ import os
 import re
 import shutil
 
-from modules import shared, backend_llamacpp, backend_tabbyapi
+from modules import shared, backend_llamacpp, backend_tabbyapi, model_index
 
 
 @dataclasses.dataclass
@@ -13,15 +13,27 @@ class ModelInfo:
     backend_type: type
     label: str = None
     fullpath: str = None
+    alias: str = None
 
     def __post_init__(self):
         self.label = f"{self.path} [{self.backend_type.backend_type}]"
         self.fullpath = os.path.join(self.model_dir, self.path)
+        self.alias = os.path.splitext(os.path.basename(self.fullpath))[0]
 
 
 models: dict[str, ModelInfo] = {}
 
 
+def find_model(name) -> ModelInfo:
+    """Finds a model by its label, path or the alias it is served under."""
+
+    if name in models:
+        return models[name]
+
+    name = (name or '').lower()
+    return next((x for x in models.values() if name in (x.path.lower(), x.alias.lower())), None)
+
+
 def is_multipart_extra(x):
     m = re.search(r"(\d+)-of-(\d+)", x)
     if not m:
@@ -30,41 +42,39 @@ def is_multipart_extra(x):
     return int(m.group(1)) > 1
 
 
-def list_models():
-    if not os.path.exists(shared.opts.model_dir):
-        return models
+def model_roots():
+    """Model directory from settings followed by additional ones, skipping those that don't exist."""
 
-    models_list = []
+    roots = [shared.opts.model_dir, *(shared.opts.extra_model_dirs or '').splitlines()]
+    return [x for x in dict.fromkeys(x.strip() for x in roots) if x and os.path.isdir(x)]
 
-    have_tabbyapi = shared.opts.tabbyapi_path and os.path.exists(shared.opts.tabbyapi_path)
-    have_llamacpp = shared.opts.llamacpp_exe and shutil.which(shared.opts.llamacpp_exe)
 
-    for root, dirs, files in os.walk(shared.opts.model_dir):
-        for filename in files:
-            if filename.endswith(".gguf") and have_llamacpp:
-                if is_multipart_extra(filename):
-                    continue
+def list_models():
+    """Updates the list of models from the model index, which is kept in memory and follows changes to model directories in the background."""
 
-                full_path = os.path.join(root, filename)
-                relative_path = os.path.relpath(full_path, shared.opts.model_dir)
-                models_list.append(ModelInfo(relative_path, shared.opts.model_dir, backend_llamacpp.BackendLlamacpp))
+    model_index.index.set_roots(model_roots())
 
-        for dirname in dirs:
-            if not have_tabbyapi:
-                break
+    have_tabbyapi = shared.opts.tabbyapi_path and os.path.exists(shared.opts.tabbyapi_path)
+    have_llamacpp = shared.opts.llamacpp_exe and shutil.which(shared.opts.llamacpp_exe)
 
-            config_fn = os.path.join(root, dirname, "config.json")
-            tokenizer_config_fn = os.path.join(root, dirname, "tokenizer_config.json")
+    models_list = []
 
-            if not os.path.exists(config_fn) or not os.path.exists(tokenizer_config_fn):
+    for root, relative_path, kind in model_index.index.list_entries():
+        if kind == model_index.kind_gguf and have_llamacpp:
+            if is_multipart_extra(os.path.basename(relative_path)):
                 continue
 
-            full_path = os.path.join(root, dirname)
-            relative_path = os.path.relpath(full_path, shared.opts.model_dir)
-            models_list.append(ModelInfo(relative_path, shared.opts.model_dir, backend_tabbyapi.BackendTabbyapi))
+            models_list.append(ModelInfo(relative_path, root, backend_llamacpp.BackendLlamacpp))
+
+        elif kind == model_index.kind_directory and have_tabbyapi:
+            models_list.append(ModelInfo(relative_path, root, backend_tabbyapi.BackendTabbyapi))
 
     models_list.sort(key=lambda x: x.path)
 
-    models.clear()
-    models.update({x.label: x for x in models_list})
+    # with several model directories, a model with the same path in a later directory is hidden by the one in the earlier
+    found = {}
+    for x in models_list:
+        found.setdefault(x.label, x)
 
+    models.clear()
+    models.update(found)
@@ -1,9 +1,14 @@
+import collections
 import dataclasses
-import queue
+import itertools
+import os
+import shutil
 import sys
 import threading
 import time
 
+from modules import shared, errors, request_stats, log_archive
+
 
 @dataclasses.dataclass
 class RequestStat:
@@ -12,42 +17,296 @@ class RequestStat:
     time_generate: float = 0
     tokens_process: int = 0
     tokens_generate: int = 0
+    tokens_cached: int = 0
+
+
+class LogFollower:
+    """
+    File-like object for reading server output from its log file while the server writes it.
+
+    readline() waits for a complete line, and returns an empty string once the process
+    has exited and everything it wrote has been read.
+
+    If max_size is set, the file is rotated when it's larger than that and everything in it
+    has been read: it's copied to the rotated path and truncated. The server must have the
+    file open for appending, so that it continues writing from the start. Lines written
+    between copying and truncating are lost.
+    """
+
+    def __init__(self, filename, process, from_end=False, poll_interval=0.1, max_size=0):
+        self.filename = filename
+        self.file = open(filename, 'r', encoding='utf8', errors='ignore')
+        self.process = process
+        self.poll_interval = poll_interval
+        self.max_size = max_size
+        self.partial = ''
+
+        if from_end:
+            self.file.seek(0, os.SEEK_END)
+
+    def readline(self):
+        while True:
+            line = self.file.readline()
+            if line.endswith('\n'):
+                line, self.partial = self.partial + line, ''
+                return line
+
+            self.partial += line
+
+            if self.process.poll() is not None:
+                line, self.partial = self.partial + self.file.readline(), ''
+                return line
+
+            self.rotate()
+            time.sleep(self.poll_interval)
+
+    def rotate(self):
+        if not self.max_size or os.fstat(self.file.fileno()).st_size <= self.max_size:
+            return
+
+        try:
+            shutil.copyfile(self.filename, log_archive.rotated_path(self.filename))
+            os.truncate(self.filename, 0)
+        except OSError as e:
+            errors.display_once(e, f'rotating log {self.filename}')
+            self.max_size = 0
+            return
+
+        self.file.seek(0)
+
+    def close(self):
+        self.file.close()
+
+
+class LogTee:
+    """
+    File-like object for reading server output from a pipe that also writes every line it reads to the log file.
+
+    If max_size is set, the log file is moved to the rotated path when it grows larger than that, and a new one is started.
+    """
+
+    def __init__(self, pipe, filename, max_size=0):
+        self.pipe = pipe
+        self.filename = filename
+        self.max_size = max_size
+        self.file = open(filename, 'w', encoding='utf8')
+        self.size = 0
+
+    def readline(self):
+        line = self.pipe.readline()
+        if line:
+            self.file.write(line)
+            self.file.flush()
+            self.size += len(line)
+
+            if self.max_size and self.size > self.max_size:
+                self.rotate()
+
+        return line
+
+    def rotate(self):
+        self.file.close()
+
+        try:
+            os.replace(self.filename, log_archive.rotated_path(self.filename))
+        except OSError as e:
+            errors.display_once(e, f'rotating log {self.filename}')
+            self.max_size = 0
+
+        self.file = open(self.filename, 'a' if not self.max_size else 'w', encoding='utf8')
+        self.size = 0
+
+    def close(self):
+        self.pipe.close()
+        self.file.close()
+
+
+class LogTail:
+    """
+    Last lines of server output, numbered from the start, so that a viewer can ask for lines after the ones it already has.
+    """
+
+    def __init__(self, maxlen=5000):
+        self.lines = collections.deque(maxlen=maxlen)
+        self.end = 0
+        self.lock = threading.Lock()
+
+    def extend(self, lines):
+        with self.lock:
+            self.lines.extend(lines)
+            self.end += len(lines)
+
+    def read(self, offset, max_lines=2000) -> tuple[str, int]:
+        """Returns text of at most max_lines last lines starting at offset, or at the oldest line still kept, and the offset to read from next time."""
+
+        with self.lock:
+            start = self.end - len(self.lines)
+            first = max(offset, start, self.end - max_lines)
+            lines = itertools.islice(self.lines, first - start, None)
+
+            return ''.join(lines), self.end
+
+
+class Subscription:
+    """
+    Lines published to a LineBus for one subscriber.
+
+    The buffer is bounded: when the subscriber falls behind, oldest lines are dropped and counted.
+    """
+
+    def __init__(self, bus, maxlen):
+        self.bus = bus
+        self.lines = collections.deque(maxlen=maxlen)
+        self.dropped = 0
+
+    def get(self, timeout=None):
+        """Returns the next line, None if there is none within timeout, or an empty string once the bus is closed and all lines are read."""
+
+        with self.bus.condition:
+            if not self.lines and not self.bus.closed:
+                self.bus.condition.wait(timeout)
+
+            if self.lines:
+                return self.lines.popleft()
+
+            return '' if self.bus.closed else None
+
+    def get_all(self, timeout=None):
+        """Returns all buffered lines, waiting up to timeout for at least one; returns None once the bus is closed and all lines are read."""
+
+        with self.bus.condition:
+            if not self.lines and not self.bus.closed:
+                self.bus.condition.wait(timeout)
+
+            if not self.lines:
+                return None if self.bus.closed else []
+
+            lines = list(self.lines)
+            self.lines.clear()
+
+            return lines
+
+    def unsubscribe(self):
+        self.bus.unsubscribe(self)
+
+
+class LineBus:
+    """Delivers every line of server output to each subscriber's own bounded buffer."""
+
+    def __init__(self):
+        self.subscribers: list[Subscription] = []
+        self.condition = threading.Condition()
+        self.closed = False
+        self.dropped = 0
+
+    def subscribe(self, maxlen=1000) -> Subscription:
+        subscription = Subscription(self, maxlen)
+
+        with self.condition:
+            self.subscribers.append(subscription)
+
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.condition:
+            if subscription in self.subscribers:
+                self.subscribers.remove(subscription)
+
+    def consume(self, func, maxlen=1000):
+        """Subscribes and calls func with lists of lines published since the previous call, in a background thread, until the bus is closed."""
+
+        subscription = self.subscribe(maxlen)
+
+        def main():
+            while (lines := subscription.get_all()) is not None:
+                if not lines:
+                    continue
+
+                try:
+                    func(lines)
+                except Exception as e:
+                    errors.display_once(e, f'processing server output with {func}')
+
+        thread = threading.Thread(target=main, daemon=True)
+        thread.start()
+
+        return subscription
+
+    def publish(self, line):
+        with self.condition:
+            for subscription in self.subscribers:
+                if len(subscription.lines) == subscription.lines.maxlen:
+                    subscription.dropped += 1
+                    self.dropped += 1
+
+                subscription.lines.append(line)
+
+            self.condition.notify_all()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
 
 
 class BaseReader:
     """
     Abstract base class for reading and parsing model server stats.
 
-    Handles the common functionality of reading from a pipe in a background
-    thread, maintaining a list of recent requests, and printing output.
+    Reads lines from a pipe in a background thread and publishes them to a line bus.
+    Stats parsing and printing output are subscribers of the bus, same as anyone
+    else interested in server output, like the startup waiter in the backend.
     Subclasses must implement the `process_line` method to handle
     the specific log format.
     """
-    def __init__(self, pipe, keep_requests_duration_sec: int = 30 * 60):
+    def __init__(self, pipe):
         self.pipe = pipe
-        self.queue = queue.Queue()
-        self.requests: list[RequestStat] = []
-        self.keep_requests_duration = keep_requests_duration_sec
+        self.bus = LineBus()
+        self.stats = request_stats.RequestStats()
+        self.on_request = None
+
+        self.tail = LogTail()
+
+        self.bus.consume(self.process_lines, maxlen=10000)
+        self.bus.consume(self.tail.extend, maxlen=10000)
+
+        if shared.opts.echo_server_output:
+            self.bus.consume(self.print_lines)
+
+    def start(self):
+        """Starts reading; subscribe to the bus before calling this to receive all lines."""
 
         thread = threading.Thread(target=self.main, args=(), daemon=True)
         thread.start()
 
     def main(self):
-        """Main loop to read lines from the pipe and process them."""
+        """Main loop to read lines from the pipe and publish them."""
 
         try:
             for line in iter(self.pipe.readline, ''):
-                self.queue.put(line)
-                print(line, end='')
-                sys.stdout.flush()
-
-                self.process_line(line.strip())
-
-                cutoff_time = time.time() - self.keep_requests_duration
-                while self.requests and self.requests[0].time < cutoff_time:
-                    self.requests.pop(0)
+                self.bus.publish(line)
         finally:
+            self.bus.close()
             self.pipe.close()
 
+    def print_lines(self, lines):
+        sys.stdout.write(''.join(lines))
+        sys.stdout.flush()
+
+    def process_lines(self, lines):
+        for line in lines:
+            self.process_line(line.strip())
+
+    def add_request(self, stat: RequestStat):
+        self.stats.add(stat.time, stat.time_process, stat.time_generate, stat.tokens_process, stat.tokens_generate, stat.tokens_cached)
+
+        if self.on_request is not None:
+            self.on_request(stat)
+
+    def list_slots(self) -> list:
+        """Per-slot stats, for servers that process several requests in parallel."""
+
+        return []
+
     def process_line(self, line: str):
         raise NotImplementedError()
@@ -1,28 +1,117 @@
+import dataclasses
 import re
 import time
 
 from modules import output_reader
 
 
+@dataclasses.dataclass
+class SlotState:
+    id: int = None
+    task_id: int = None
+    busy: bool = False
+    tokens_prompt: int = None
+    request: output_reader.RequestStat = dataclasses.field(default_factory=output_reader.RequestStat)
+    requests: int = 0
+    tokens_cached: int = 0
+
+
 class ReaderLlamacpp(output_reader.BaseReader):
+    """
+    Parses llama-server output, keeping track of each slot separately.
+
+    With several parallel slots, lines about different requests interleave; timing lines are
+    attributed to the slot named by the last line with a slot id, which for current versions
+    is the `print_timing: id N | task M |` line printed right before them.
+    """
+
     def __init__(self, pipe):
         super().__init__(pipe)
-        self.current_request = output_reader.RequestStat()
+        self.slots: dict[int, SlotState] = {}
+        self.current_slot = self.slot(None)
+        self.max_concurrency = 0
 
         self.re_prompt = re.compile(r'prompt eval time =\s*([\d.]+) ms\s*/\s*(\d+) tokens')
         self.re_eval = re.compile(r'eval time =\s*([\d.]+) ms\s*/\s*(\d+) tokens')
 
+        self.re_slot = re.compile(r'\bid\s+(\d+) \| task (-?\d+) \|')
+        self.re_slot_legacy = re.compile(r'\bid_slot=(\d+) id_task=(-?\d+)')
+        self.re_slot_launch_legacy = re.compile(r'\bslot (\d+) is processing \[task id: (\d+)\]')
+        self.re_slot_release_legacy = re.compile(r'\bslot (\d+) released\b')
+        self.re_prompt_tokens = re.compile(r'\bn_prompt_tokens = (\d+)')
+
+    def slot(self, slot_id) -> SlotState:
+        slot = self.slots.get(slot_id)
+        if slot is None:
+            slot = self.slots[slot_id] = SlotState(id=slot_id)
+
+        return slot
+
+    def list_slots(self) -> list[SlotState]:
+        """Slots seen in server output, not including the placeholder for output that doesn't name a slot."""
+
+        return sorted((x for x in list(self.slots.values()) if x.id is not None), key=lambda x: x.id)
+
+    def busy_slots(self):
+        return sum(1 for x in list(self.slots.values()) if x.busy)
+
+    def set_busy(self, slot: SlotState, busy):
+        slot.busy = busy
+        self.max_concurrency = max(self.max_concurrency, self.busy_slots())
+
+    def process_slot_line(self, line):
+        m = self.re_slot.search(line) or self.re_slot_legacy.search(line)
+        if m:
+            self.current_slot = self.slot(int(m.group(1)))
+            self.current_slot.task_id = int(m.group(2))
+
+            if 'processing task' in line:
+                self.set_busy(self.current_slot, True)
+            elif 'stop processing' in line:
+                self.set_busy(self.current_slot, False)
+
+            m = self.re_prompt_tokens.search(line)
+            if m:
+                self.current_slot.tokens_prompt = int(m.group(1))
+
+            return
+
+        m = self.re_slot_launch_legacy.search(line)
+        if m:
+            self.current_slot = self.slot(int(m.group(1)))
+            self.current_slot.task_id = int(m.group(2))
+            self.set_busy(self.current_slot, True)
+            return
+
+        m = self.re_slot_release_legacy.search(line)
+        if m:
+            self.set_busy(self.slot(int(m.group(1))), False)
+
     def process_line(self, line):
+        self.process_slot_line(line)
+
+        slot = self.current_slot
+
         m = self.re_prompt.search(line)
         if m:
-            self.current_request.time = time.time()
-            self.current_request.time_process = float(m.group(1))
-            self.current_request.tokens_process = int(m.group(2))
+            slot.request.time = time.time()
+            slot.request.time_process = float(m.group(1))
+            slot.request.tokens_process = int(m.group(2))
+
+            if slot.tokens_prompt is not None:
+                slot.request.tokens_cached = max(slot.tokens_prompt - slot.request.tokens_process, 0)
+                slot.tokens_prompt = None
+
             return
 
         m = self.re_eval.search(line)
         if m:
-            self.current_request.time_generate = float(m.group(1))
-            self.current_request.tokens_generate = int(m.group(2))
-            self.requests.append(self.current_request)
-            self.current_request = output_reader.RequestStat()
+            slot.request.time = slot.request.time or time.time()
+            slot.request.time_generate = float(m.group(1))
+            slot.request.tokens_generate = int(m.group(2))
+
+            slot.requests += 1
+            slot.tokens_cached += slot.request.tokens_cached
+
+            self.add_request(slot.request)
+            slot.request = output_reader.RequestStat()
@@ -31,4 +31,4 @@ class ReaderTabbyapi(output_reader.BaseReader):
             tokens_generate=total_generated,
         )
 
-        self.requests.append(stat)
+        self.add_request(stat)
@@ -0,0 +1,168 @@
+import http.client
+import http.server
+import json
+import threading
+
+from modules import shared, models, errors, backend, metrics
+
+hop_by_hop_headers = {'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te', 'trailers', 'transfer-encoding', 'upgrade', 'host', 'content-length'}
+
+
+class ProxyHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Forwards OpenAI-compatible /v1/* requests to the backend serving the requested model.
+
+    Requests wait in a queue while the backend is starting or restarting, and while all of its
+    slots are busy; when the queue is full, new requests are rejected with 429.
+    """
+
+    launcher = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.forward()
+
+    def do_POST(self):
+        self.forward()
+
+    def do_DELETE(self):
+        self.forward()
+
+    def send_json(self, code, data):
+        body = json.dumps(data).encode('utf8')
+
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_metrics(self):
+        body = metrics.render(self.launcher).encode('utf8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', metrics.content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, code, message):
+        self.send_json(code, {"error": {"message": message, "code": code}})
+
+    def list_models(self):
+        if shared.opts.lazy_loading:
+            available = list(models.models.values())
+        else:
+            available = [x.model for x in self.launcher.pool.list_running() if not x.over]
+
+        self.send_json(200, {
+            "object": "list",
+            "data": [{"id": x.alias, "object": "model", "owned_by": "llm-launcher"} for x in available],
+        })
+
+    def forward(self):
+        if self.command == 'GET' and self.path == '/metrics':
+            self.send_metrics()
+            return
+
+        if not self.path.startswith('/v1/'):
+            self.send_error_json(404, f"Not found: {self.path}")
+            return
+
+        if self.command == 'GET' and self.path.rstrip('/') == '/v1/models':
+            self.list_models()
+            return
+
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+        model_name = None
+        if body:
+            try:
+                model_name = json.loads(body).get('model')
+            except (ValueError, AttributeError):
+                pass
+
+        while True:
+            try:
+                bknd = self.launcher.acquire_backend(model_name)
+            except Exception as e:
+                errors.display(e, 'starting backend for request', full_traceback=True)
+                self.send_error_json(500, f"Failed to start backend: {e}")
+                return
+
+            if bknd is None:
+                self.send_error_json(404, f"Model not found: {model_name}")
+                return
+
+            try:
+                bknd.admit(shared.opts.proxy_ready_timeout, shared.opts.proxy_max_queue)
+                break
+            except backend.AdmissionError as e:
+                if not e.retry:
+                    self.send_error_json(e.code, str(e))
+                    return
+
+        try:
+            self.forward_to(bknd, body)
+        finally:
+            bknd.release()
+
+    def forward_to(self, bknd, body):
+        headers = {k: v for k, v in self.headers.items() if k.lower() not in hop_by_hop_headers}
+        conn = http.client.HTTPConnection(bknd.connect_host(), int(bknd.port), timeout=shared.opts.proxy_ready_timeout)
+        response_started = False
+
+        try:
+            conn.request(self.command, self.path, body=body or None, headers=headers)
+            response = conn.getresponse()
+
+            self.send_response(response.status, response.reason)
+            response_started = True
+            for k, v in response.getheaders():
+                if k.lower() not in hop_by_hop_headers:
+                    self.send_header(k, v)
+
+            length = response.getheader('Content-Length')
+            if length is not None:
+                self.send_header('Content-Length', length)
+            else:
+                self.send_header('Connection', 'close')
+                self.close_connection = True
+
+            self.end_headers()
+
+            while True:
+                chunk = response.read1(65536)
+                if not chunk:
+                    break
+
+                self.wfile.write(chunk)
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except OSError as e:
+            if response_started:
+                self.close_connection = True
+            else:
+                self.send_error_json(502, f"Error talking to backend: {e}")
+        finally:
+            conn.close()
+
+
+def start(launcher):
+    if not shared.opts.proxy_port:
+        return None
+
+    handler = type('LauncherProxyHandler', (ProxyHandler,), {'launcher': launcher})
+
+    server = http.server.ThreadingHTTPServer((shared.opts.proxy_host, int(shared.opts.proxy_port)), handler)
+    server.daemon_threads = True
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    print(f"Proxy listening on http://{shared.opts.proxy_host}:{shared.opts.proxy_port}")
+
+    return server
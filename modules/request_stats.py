@@ -0,0 +1,251 @@
+import array
+import math
+import threading
+import time
+
+windows = {
+    "1 min": 60,
+    "5 min": 5 * 60,
+    "30 min": 30 * 60,
+}
+
+
+class QuantileSketch:
+    """
+    Streaming histogram with logarithmic buckets for estimating percentiles of positive values.
+
+    Each bucket covers values within `accuracy` relative error of each other, so memory is bounded
+    by the range of values rather than their count, and two sketches are merged by adding bucket counts.
+    """
+
+    __slots__ = ('buckets', 'count', 'zeros', 'sum')
+
+    accuracy = 0.01
+    gamma = (1 + accuracy) / (1 - accuracy)
+    log_gamma = math.log(gamma)
+
+    def __init__(self):
+        self.buckets: dict[int, int] = {}
+        self.count = 0
+        self.zeros = 0
+        self.sum = 0.0
+
+    def add(self, value):
+        if value is None:
+            return
+
+        self.count += 1
+        self.sum += value
+
+        if value <= 0:
+            self.zeros += 1
+            return
+
+        index = math.ceil(math.log(value) / self.log_gamma)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def merge(self, other: 'QuantileSketch'):
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+
+        self.count += other.count
+        self.zeros += other.zeros
+        self.sum += other.sum
+
+    def count_at_most(self, value):
+        """Number of values not greater than value, exact up to the width of the bucket value falls into."""
+
+        if value <= 0:
+            return self.zeros
+
+        limit = math.floor(math.log(value) / self.log_gamma + 1e-9)
+        return self.zeros + sum(count for index, count in self.buckets.items() if index <= limit)
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+
+class LatencySketches:
+    """Latency percentiles of requests completed within one minute, or merged from several minutes."""
+
+    __slots__ = ('minute', 'time_process', 'time_generate', 'time_per_token')
+
+    def __init__(self, minute=0):
+        self.minute = minute
+        self.time_process = QuantileSketch()
+        self.time_generate = QuantileSketch()
+        self.time_per_token = QuantileSketch()
+
+    def merge(self, other: 'LatencySketches'):
+        self.time_process.merge(other.time_process)
+        self.time_generate.merge(other.time_generate)
+        self.time_per_token.merge(other.time_per_token)
+
+
+class WindowSums:
+    __slots__ = ('duration', 'start', 'requests', 'tokens_process', 'tokens_generate', 'tokens_cached', 'time_process', 'time_generate')
+
+    def __init__(self, duration):
+        self.duration = duration
+        self.start = 0
+        self.requests = 0
+        self.tokens_process = 0
+        self.tokens_generate = 0
+        self.tokens_cached = 0
+        self.time_process = 0.0
+        self.time_generate = 0.0
+
+    def copy(self):
+        res = WindowSums(self.duration)
+        for name in self.__slots__:
+            setattr(res, name, getattr(self, name))
+
+        return res
+
+    def generate_speed(self):
+        return self.tokens_generate / self.time_generate * 1000 if self.time_generate else 0
+
+    def process_speed(self):
+        return self.tokens_process / self.time_process * 1000 if self.time_process else 0
+
+
+class RequestStats:
+    """
+    Completed requests stored column by column in a fixed-size ring buffer, with running sums over time windows.
+
+    Each window remembers where its oldest request is in the buffer; sums are updated when a request
+    is added and when it falls out of the window, so both adding and reading are O(1) amortized.
+    When the buffer is full, the oldest request is removed from all windows before it's overwritten.
+
+    Latency percentiles are kept in quantile sketches, one set per minute for as many minutes as the
+    longest window; a window's percentiles merge the sketches of the minutes it covers.
+
+    Sums and sketches for all requests since the server started are kept too, for exporting as counters.
+    """
+
+    def __init__(self, capacity=65536):
+        self.capacity = capacity
+        self.time = array.array('d', bytes(8 * capacity))
+        self.time_process = array.array('d', bytes(8 * capacity))
+        self.time_generate = array.array('d', bytes(8 * capacity))
+        self.tokens_process = array.array('q', bytes(8 * capacity))
+        self.tokens_generate = array.array('q', bytes(8 * capacity))
+        self.tokens_cached = array.array('q', bytes(8 * capacity))
+
+        self.end = 0
+        self.windows = {name: WindowSums(duration) for name, duration in windows.items()}
+        self.minutes: list[LatencySketches] = [LatencySketches(-1) for _ in range(math.ceil(max(windows.values()) / 60))]
+        self.total = WindowSums(0)
+        self.latency_total = LatencySketches()
+        self.lock = threading.Lock()
+
+    def remove_oldest(self, window: WindowSums):
+        i = window.start % self.capacity
+
+        window.requests -= 1
+        window.tokens_process -= self.tokens_process[i]
+        window.tokens_generate -= self.tokens_generate[i]
+        window.tokens_cached -= self.tokens_cached[i]
+        window.time_process -= self.time_process[i]
+        window.time_generate -= self.time_generate[i]
+        window.start += 1
+
+        if window.requests == 0:
+            window.time_process = 0.0
+            window.time_generate = 0.0
+
+    def expire(self, window: WindowSums, now):
+        cutoff = now - window.duration
+
+        while window.start < self.end and self.time[window.start % self.capacity] < cutoff:
+            self.remove_oldest(window)
+
+    def add(self, time_done, time_process, time_generate, tokens_process, tokens_generate, tokens_cached=0, lifetime=True):
+        """
+        Records a completed request; time_process/time_generate are in milliseconds and may be None if unknown, in which case the matching token count is ignored.
+
+        tokens_cached is the number of prompt tokens reused from the cache rather than processed.
+        Requests loaded from history are added with lifetime=False, so that they don't count towards totals since the server started.
+        """
+
+        if time_process is None:
+            time_process, tokens_process = 0.0, 0
+
+        if time_generate is None:
+            time_generate, tokens_generate = 0.0, 0
+
+        with self.lock:
+            for window in self.windows.values():
+                if self.end - window.start >= self.capacity:
+                    self.remove_oldest(window)
+
+            i = self.end % self.capacity
+            self.time[i] = time_done
+            self.time_process[i] = time_process
+            self.time_generate[i] = time_generate
+            self.tokens_process[i] = tokens_process or 0
+            self.tokens_generate[i] = tokens_generate or 0
+            self.tokens_cached[i] = tokens_cached or 0
+            self.end += 1
+
+            minute = int(time_done // 60)
+            if self.minutes[minute % len(self.minutes)].minute != minute:
+                self.minutes[minute % len(self.minutes)] = LatencySketches(minute)
+
+            for sketches in (self.minutes[minute % len(self.minutes)], *([self.latency_total] if lifetime else [])):
+                sketches.time_process.add(time_process if tokens_process else None)
+                sketches.time_generate.add(time_generate if tokens_generate else None)
+                sketches.time_per_token.add(time_generate / tokens_generate if tokens_generate else None)
+
+            for window in (*self.windows.values(), *([self.total] if lifetime else [])):
+                window.requests += 1
+                window.tokens_process += self.tokens_process[i]
+                window.tokens_generate += self.tokens_generate[i]
+                window.tokens_cached += self.tokens_cached[i]
+                window.time_process += time_process
+                window.time_generate += time_generate
+
+    def window(self, name) -> WindowSums:
+        """Returns a copy of sums for requests completed within the named window, as listed in `windows`."""
+
+        with self.lock:
+            window = self.windows[name]
+            self.expire(window, time.time())
+
+            return window.copy()
+
+    def latency(self, name) -> LatencySketches:
+        """Returns merged latency sketches for the named window, rounded up to whole minutes."""
+
+        minute = int(time.time() // 60)
+        first = minute - math.ceil(windows[name] / 60) + 1
+        res = LatencySketches(minute)
+
+        with self.lock:
+            for sketches in self.minutes:
+                if first <= sketches.minute <= minute:
+                    res.merge(sketches)
+
+        return res
+
+    def totals(self) -> tuple[WindowSums, LatencySketches]:
+        """Returns copies of sums and latency sketches for all requests since the server started."""
+
+        with self.lock:
+            latency = LatencySketches()
+            latency.merge(self.latency_total)
+
+            return self.total.copy(), latency
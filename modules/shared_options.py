@@ -1,26 +1,63 @@
 import gradio as gr
 
-from modules import settings, shared_options_funcs
+from modules import settings, shared_options_funcs, request_stats
 
 general = settings.Section('General')
 llamacpp = settings.Section('Llama.cpp')
 tabbyapi = settings.Section('TabbyAPI')
+proxy = settings.Section('Proxy')
 
 templates = [
     settings.Template(general, "model_dir", '', "Model directory"),
-    settings.Template(general, "model", None, "Selected model", gr.Dropdown, lambda: {"choices": shared_options_funcs.list_models(), "allow_custom_value": False}, refresh=shared_options_funcs.list_models),
+    settings.Template(general, "extra_model_dirs", '', "Additional model directories", gr.Textbox, dict(lines=3), info="One directory per line; if several directories have a model with the same path, the one from the directory listed first is used"),
+    settings.Template(general, "model_index_interval", 60, "How often to check model directories for changes, seconds", gr.Number, info="On Linux, changes are picked up right away with inotify; this check catches the rest, like changes made to network storage from other machines; 0 = only when refreshing the model list"),
+    settings.Template(general, "model", None, "Selected model", gr.Dropdown, lambda: {"choices": shared_options_funcs.list_models(), "allow_custom_value": False}, refresh=shared_options_funcs.refresh_models),
     settings.Template(general, "run_at_startup", True, "Run the backend at startup", gr.Checkbox),
     settings.Template(general, "backend_startup_timeout", 30, "Startup inactivity detection timeout", gr.Number),
+    settings.Template(general, "restart_backoff_max", 60, "Maximum delay before restarting a crashed backend, seconds", gr.Number, info="The delay doubles with every crash shortly after start"),
+    settings.Template(general, "crash_loop_uptime", 60, "Count a backend crash as a fast failure if it ran less than, seconds", gr.Number),
+    settings.Template(general, "crash_loop_failures", 5, "Stop restarting a backend after this many fast failures in a row", gr.Number, info="0 = never stop"),
+    settings.Template(general, "health_probe_interval", 5, "Health check interval, seconds", gr.Number, info="The backend is ready as soon as its health endpoint answers, and is restarted when it stops answering; 0 = only use server output"),
+    settings.Template(general, "health_probe_timeout", 5, "Health check timeout, seconds", gr.Number),
+    settings.Template(general, "health_probe_failures", 3, "Restart the backend after this many failed health checks in a row", gr.Number),
+    settings.Template(general, "server_stats_interval", 2, "How often to poll the server for busy slots and KV cache usage, seconds", gr.Number, info="llama.cpp only; queue and KV cache stats need --metrics in command line options; 0 = off"),
+    settings.Template(general, "backend_port_range", '8081-8099', "Ports for backends to listen on", info="Used when the port from backend settings is taken by another running model; format: 8081-8099"),
+    settings.Template(general, "keep_backends_running", False, "Keep backends running when the launcher exits", gr.Checkbox, info="Backends that are still running are picked up when the launcher starts again, without reloading the model"),
+    settings.Template(general, "blue_green", False, "Zero-downtime restarts and model switches", gr.Checkbox, info="Start the new backend on a spare port and keep the old one serving requests until the new one is ready"),
+    settings.Template(general, "drain_timeout", 30, "How long to wait for requests to finish before stopping a backend, seconds", gr.Number),
+    settings.Template(general, "shutdown_timeout", 10, "How long to wait for a backend to exit before killing it, seconds", gr.Number),
+    settings.Template(general, "memory_budget_gb", 0, "Memory budget for models running at the same time, GB", gr.Number, info="Least recently used models are stopped to make room for a new one; 0 = unlimited"),
+    settings.Template(general, "stats_window", "30 min", "Show stats for requests completed in the last", gr.Radio, lambda: {"choices": list(request_stats.windows)}),
+    settings.Template(general, "telemetry_interval", 2, "How often to sample CPU, memory and I/O usage of backends, seconds", gr.Number, info="Per-process stats are Linux only; GPU stats come from the nvidia-ml-py package if it's installed, otherwise from nvidia-smi; 0 = off"),
+    settings.Template(general, "stats_db", True, "Keep request stats on disk", gr.Checkbox, info="Stats survive restarts and can be viewed for long periods of time"),
+    settings.Template(general, "stats_db_raw_days", 7, "Keep stats for individual requests for, days", gr.Number),
+    settings.Template(general, "stats_db_minute_days", 90, "Keep per-minute stats for, days", gr.Number, info="Per-hour stats are kept forever"),
+    settings.Template(general, "echo_server_output", True, "Print server output to the launcher's console", gr.Checkbox),
+    settings.Template(general, "log_retention_runs", 20, "Keep server logs for this many runs of each model", gr.Number, info="Logs are in the logs directory, one file per run"),
+    settings.Template(general, "log_max_size_mb", 100, "Rotate the log of a running server when it grows larger than, MB", gr.Number, info="The older part is kept next to the log with .1 added to its name; 0 = no limit"),
 
     settings.Template(llamacpp, "llamacpp_exe", 'llama-server', "Llamacpp executable"),
     settings.Template(llamacpp, "llamacpp_port", '8080', "Port for llamacpp to listen on"),
     settings.Template(llamacpp, "llamacpp_host", '0.0.0.0', "Host for llamacpp to listen on"),
     settings.Template(llamacpp, "llamacpp_cmdline", '', "Command line options"),
     settings.Template(llamacpp, "llamacpp_cmdline_permodel", '', "Model-specific command-line options", gr.Textbox, dict(lines=8), info="One model per line, like this: (copy model name from the main page)\nmodel.gguf: --flash-attn\nllama6.gguf: --ctx-size 4096"),
+    settings.Template(llamacpp, "llamacpp_fallback_profiles", '', "Fallback options for when the server runs out of memory", info="Separated by |, tried one after another; like this: --ctx-size 8192 | --ctx-size 4096 -ngl 30 | --ctx-size 4096 -ngl 20 -ctk q8_0 -ctv q8_0"),
+    settings.Template(llamacpp, "llamacpp_fallback_profiles_permodel", '', "Model-specific fallback options", gr.Textbox, dict(lines=4), info="One model per line, like this:\nmodel.gguf: --ctx-size 16384 | --ctx-size 8192 -ngl 40"),
 
     settings.Template(tabbyapi, "tabbyapi_path", '', "Path to TabbyAPI installation dir"),
     settings.Template(tabbyapi, "tabbyapi_port", '5000', "Port for TabbyAPI to listen on"),
     settings.Template(tabbyapi, "tabbyapi_host", '0.0.0.0', "Host for TabbyAPI to listen on"),
     settings.Template(tabbyapi, "tabbyapi_cmdline", '', "Command line options"),
     settings.Template(tabbyapi, "tabbyapi_cmdline_permodel", '', "Model-specific command-line options", gr.Textbox, dict(lines=8), info="One model per line, like this: (copy model name from the main page)\nmodel-exl2: --log-prompt\nllama7-exl4: --cache-size 8192"),
+    settings.Template(tabbyapi, "tabbyapi_fallback_profiles", '', "Fallback options for when the server runs out of memory", info="Separated by |, tried one after another; like this: --cache-size 8192 | --cache-size 4096 --cache-mode Q8"),
+    settings.Template(tabbyapi, "tabbyapi_fallback_profiles_permodel", '', "Model-specific fallback options", gr.Textbox, dict(lines=4), info="One model per line, like this:\nllama7-exl4: --max-seq-len 16384 | --max-seq-len 8192 --cache-mode Q8"),
+
+    settings.Template(proxy, "proxy_port", '', "Port for the OpenAI-compatible proxy to listen on", info="Requests to /v1/* are forwarded to the backend of the model named in the request, or to the selected model; empty = disabled; requires restart"),
+    settings.Template(proxy, "proxy_host", '0.0.0.0', "Host for the proxy to listen on"),
+    settings.Template(proxy, "proxy_ready_timeout", 600, "How long a request can wait in the queue for its backend, seconds", gr.Number),
+    settings.Template(proxy, "proxy_max_queue", 64, "Maximum number of requests waiting for a backend", gr.Number, info="Requests over this limit are rejected with 429"),
+    settings.Template(proxy, "proxy_concurrency_limit", 0, "Maximum number of requests forwarded to a backend at the same time", gr.Number, info="0 = number of slots the server reports (unlimited if unknown)"),
+    settings.Template(proxy, "lazy_loading", False, "Start models on demand", gr.Checkbox, info="A request for a model that is not running starts it"),
+    settings.Template(proxy, "idle_unload_timeout", 0, "Stop models started on demand after being idle for, seconds", gr.Number, info="0 = never"),
+    settings.Template(proxy, "idle_unload_timeout_permodel", '', "Model-specific idle timeouts", gr.Textbox, dict(lines=4), info="One model per line, like this:\nmodel.gguf: 600\nllama7-exl4: 3600"),
 ]
@@ -1,7 +1,14 @@
-from modules import models
+from modules import models, model_index
 
 
 def list_models():
     models.list_models()
 
     return list(models.models)
+
+
+def refresh_models():
+    """Checks model directories for changes, waiting for at most a couple of seconds so that slow storage doesn't hold up the UI."""
+
+    model_index.index.start()
+    model_index.index.request_reconcile(timeout=2)
@@ -0,0 +1,208 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from modules import shared, errors
+
+db_filename = os.path.join(shared.script_path, 'stats.db')
+
+columns = ['time_process', 'time_generate', 'tokens_process', 'tokens_generate', 'tokens_cached']
+column_types = {'time_process': 'REAL', 'time_generate': 'REAL', 'tokens_process': 'INTEGER', 'tokens_generate': 'INTEGER', 'tokens_cached': 'INTEGER'}
+
+rollups = {
+    'rollup_minute': 60,
+    'rollup_hour': 60 * 60,
+}
+
+schema = f"""
+CREATE TABLE IF NOT EXISTS requests (
+    time REAL NOT NULL,
+    model TEXT NOT NULL,
+    backend_type TEXT NOT NULL,
+    build TEXT,
+    {", ".join(f"{x} {column_types[x]} NOT NULL DEFAULT 0" for x in columns)}
+);
+CREATE INDEX IF NOT EXISTS requests_model_time ON requests (model, time);
+CREATE INDEX IF NOT EXISTS requests_time ON requests (time);
+""" + "".join(f"""
+CREATE TABLE IF NOT EXISTS {table} (
+    bucket INTEGER NOT NULL,
+    model TEXT NOT NULL,
+    backend_type TEXT NOT NULL,
+    build TEXT NOT NULL DEFAULT '',
+    requests INTEGER NOT NULL DEFAULT 0,
+    {", ".join(f"{x} {column_types[x]} NOT NULL DEFAULT 0" for x in columns)},
+    PRIMARY KEY (bucket, model, backend_type, build)
+);
+""" for table in rollups)
+
+
+class StatsDb:
+    """
+    Completed requests stored in an SQLite database, so that stats survive restarts of backends and of the launcher.
+
+    Every request is kept in the requests table for stats_db_raw_days days, and is added to per-minute and per-hour
+    rollups, which are used to answer queries over long ranges. Requests are written in batches from a background
+    thread; record() only puts them into a queue, and drops them if the queue is full.
+    """
+
+    def __init__(self, filename, batch_interval=2.0, max_pending=10000):
+        self.filename = filename
+        self.batch_interval = batch_interval
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.dropped = 0
+        self.thread = None
+        self.lock = threading.Lock()
+        self.cleaned_at = 0
+
+    def connect(self):
+        conn = sqlite3.connect(self.filename, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+
+            conn = self.connect()
+            try:
+                conn.executescript(schema)
+            finally:
+                conn.close()
+
+            self.thread = threading.Thread(target=self.writer_main, daemon=True)
+            self.thread.start()
+
+    def record(self, bknd, stat):
+        if not shared.opts.stats_db:
+            return
+
+        self.start()
+
+        row = (stat.time, bknd.model.path, bknd.backend_type, bknd.build_version or '', *(getattr(stat, x) or 0 for x in columns))
+
+        try:
+            self.pending.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout=10):
+        """Waits until requests recorded so far are written."""
+
+        if self.thread is None:
+            return
+
+        done = threading.Event()
+        self.pending.put(done)
+        done.wait(timeout)
+
+    def writer_main(self):
+        conn = self.connect()
+
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.time() + self.batch_interval
+
+            while not isinstance(batch[-1], threading.Event) and (remaining := deadline - time.time()) > 0:
+                try:
+                    batch.append(self.pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            rows = [x for x in batch if not isinstance(x, threading.Event)]
+
+            try:
+                self.write(conn, rows)
+                self.clean(conn)
+            except sqlite3.Error as e:
+                errors.display(e, 'writing request stats')
+
+            for event in (x for x in batch if isinstance(x, threading.Event)):
+                event.set()
+
+    def write(self, conn, rows):
+        if not rows:
+            return
+
+        placeholders = ", ".join("?" for _ in range(4 + len(columns)))
+        update = ", ".join(f"{x} = {x} + excluded.{x}" for x in ['requests', *columns])
+
+        with conn:
+            conn.executemany(f"INSERT INTO requests (time, model, backend_type, build, {', '.join(columns)}) VALUES ({placeholders})", rows)
+
+            for table, step in rollups.items():
+                conn.executemany(f"""
+                    INSERT INTO {table} (bucket, model, backend_type, build, requests, {', '.join(columns)}) VALUES (?, ?, ?, ?, 1, {', '.join('?' for _ in columns)})
+                    ON CONFLICT (bucket, model, backend_type, build) DO UPDATE SET {update}
+                """, [(int(row[0] // step) * step, *row[1:]) for row in rows])
+
+    def clean(self, conn):
+        """Removes old requests and per-minute rollups once an hour; per-hour rollups are kept forever."""
+
+        if time.time() - self.cleaned_at < 60 * 60:
+            return
+
+        self.cleaned_at = time.time()
+
+        with conn:
+            conn.execute("DELETE FROM requests WHERE time < ?", (time.time() - shared.opts.stats_db_raw_days * 24 * 60 * 60,))
+            conn.execute("DELETE FROM rollup_minute WHERE bucket < ?", (time.time() - shared.opts.stats_db_minute_days * 24 * 60 * 60,))
+
+    def recent_requests(self, model, since):
+        """Returns (time, *columns) rows for requests to the model completed after since, oldest first; token counts are ints."""
+
+        if not os.path.exists(self.filename):
+            return []
+
+        conn = self.connect()
+        try:
+            rows = conn.execute(f"SELECT time, {', '.join(columns)} FROM requests WHERE model = ? AND time >= ? ORDER BY time", (model, since)).fetchall()
+        finally:
+            conn.close()
+
+        # databases created before token columns were INTEGER store them as REAL
+        return [(row[0], *(int(value) if column_types[x] == 'INTEGER' else value for x, value in zip(columns, row[1:]))) for row in rows]
+
+    def query(self, start, end, step, model=None):
+        """
+        Returns a list of dicts with sums of requests, times and tokens for every step seconds between start and end.
+
+        Steps of at least an hour or a minute are answered from rollups, shorter ones from individual requests.
+        """
+
+        if not os.path.exists(self.filename):
+            return []
+
+        step = max(int(step), 1)
+        table = next((table for table, table_step in sorted(rollups.items(), key=lambda x: -x[1]) if step >= table_step and step % table_step == 0), None)
+
+        if table is None:
+            source, time_column, count = "requests", "time", "COUNT(*)"
+        else:
+            source, time_column, count = table, "bucket", "SUM(requests)"
+
+        where = f"{time_column} >= ? AND {time_column} < ?"
+        params = [start, end]
+        if model is not None:
+            where += " AND model = ?"
+            params.append(model)
+
+        sql = f"""
+            SELECT CAST({time_column} / {step} AS INTEGER) * {step} AS t, {count}, {', '.join(f"SUM({x})" for x in columns)}
+            FROM {source} WHERE {where} GROUP BY t ORDER BY t
+        """
+
+        conn = self.connect()
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+        return [dict(zip(['time', 'requests', *columns], row)) for row in rows]
+
+
+db = StatsDb(db_filename)
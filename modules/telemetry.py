@@ -0,0 +1,380 @@
+import collections
+import ctypes
+import dataclasses
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+from modules import shared, errors
+
+try:
+    import pynvml
+except ImportError:
+    pynvml = None
+
+
+@dataclasses.dataclass
+class ProcessSample:
+    time: float
+    pid: int
+    cpu_time: float = 0
+    rss: int = 0
+    pss: int = None
+    swap: int = 0
+    threads: int = 0
+    minor_faults: int = 0
+    major_faults: int = 0
+    read_bytes: int = None
+    write_bytes: int = None
+    gpu_memory: int = None
+
+
+@dataclasses.dataclass
+class ProcessRates:
+    cpu_percent: float = 0
+    minor_faults: float = 0
+    major_faults: float = 0
+    read_bytes: float = None
+    write_bytes: float = None
+
+
+@dataclasses.dataclass
+class GpuSample:
+    index: int
+    name: str
+    memory_used: int
+    memory_total: int
+    utilization: int = None
+    temperature: int = None
+
+
+@dataclasses.dataclass
+class HostSample:
+    time: float
+    memory_total: int = None
+    memory_available: int = None
+    swap_total: int = None
+    swap_free: int = None
+    loadavg: tuple = None
+    pressure: dict[str, float] = dataclasses.field(default_factory=dict)
+    disk_total: int = None
+    disk_free: int = None
+    gpus: list[GpuSample] = dataclasses.field(default_factory=list)
+
+
+def read_file(path):
+    try:
+        with open(path, 'r', encoding='utf8') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def read_kb_fields(path):
+    """Reads a file of `Name:   123 kB` lines, like /proc/meminfo, into a dict of name to bytes."""
+
+    text = read_file(path)
+    if text is None:
+        return None
+
+    res = {}
+    for line in text.splitlines():
+        name, _, value = line.partition(':')
+        parts = value.split()
+        if parts and parts[0].isdigit():
+            res[name.strip()] = int(parts[0]) * (1024 if parts[1:] == ['kB'] else 1)
+
+    return res
+
+
+def sample_process(pid) -> ProcessSample:
+    text = read_file(f'/proc/{pid}/stat')
+    if text is None:
+        return None
+
+    # fields after the command name, which is in parentheses and can contain spaces; fields[0] is field 3 of stat(5)
+    fields = text[text.rindex(')') + 2:].split()
+    clock_ticks = os.sysconf('SC_CLK_TCK')
+
+    sample = ProcessSample(
+        time=time.time(),
+        pid=pid,
+        cpu_time=(int(fields[11]) + int(fields[12])) / clock_ticks,
+        threads=int(fields[17]),
+        minor_faults=int(fields[7]),
+        major_faults=int(fields[9]),
+    )
+
+    status = read_kb_fields(f'/proc/{pid}/status') or {}
+    sample.rss = status.get('VmRSS', 0)
+    sample.swap = status.get('VmSwap', 0)
+
+    rollup = read_kb_fields(f'/proc/{pid}/smaps_rollup') or {}
+    sample.pss = rollup.get('Pss')
+
+    io = read_kb_fields(f'/proc/{pid}/io') or {}
+    sample.read_bytes = io.get('read_bytes')
+    sample.write_bytes = io.get('write_bytes')
+
+    return sample
+
+
+def read_memory():
+    """Returns total and available physical memory in bytes on systems without /proc/meminfo; either can be None."""
+
+    if os.name == 'nt':
+        class MemoryStatus(ctypes.Structure):
+            _fields_ = [('length', ctypes.c_ulong), ('memory_load', ctypes.c_ulong)] + [(x, ctypes.c_ulonglong) for x in ['total_phys', 'avail_phys', 'total_page_file', 'avail_page_file', 'total_virtual', 'avail_virtual', 'avail_extended_virtual']]
+
+        status = MemoryStatus(length=ctypes.sizeof(MemoryStatus))
+        if not ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return None, None
+
+        return status.total_phys, status.avail_phys
+
+    def pages(name):
+        try:
+            return os.sysconf(name) * os.sysconf('SC_PAGE_SIZE')
+        except (ValueError, OSError, AttributeError):
+            return None
+
+    return pages('SC_PHYS_PAGES'), pages('SC_AVPHYS_PAGES')
+
+
+def sample_gpus_nvidia_smi() -> tuple[list[GpuSample], dict[int, int]]:
+    """Same as TelemetrySampler.sample_gpus, from nvidia-smi output, for when pynvml is not installed."""
+
+    def query(*args):
+        output = subprocess.run(['nvidia-smi', *args, '--format=csv,noheader,nounits'], capture_output=True, text=True, timeout=10, check=True).stdout
+        return [[x.strip() for x in line.split(',')] for line in output.splitlines() if line.strip()]
+
+    def number(value):
+        try:
+            return int(float(value))
+        except ValueError:
+            return None
+
+    mib = 1024 * 1024
+
+    gpus = []
+    for index, name, memory_used, memory_total, utilization, temperature in query('--query-gpu=index,name,memory.used,memory.total,utilization.gpu,temperature.gpu'):
+        gpus.append(GpuSample(index=int(index), name=name, memory_used=(number(memory_used) or 0) * mib, memory_total=(number(memory_total) or 0) * mib, utilization=number(utilization), temperature=number(temperature)))
+
+    process_memory = {}
+    try:
+        for pid, used_memory in query('--query-compute-apps=pid,used_memory'):
+            process_memory[int(pid)] = process_memory.get(int(pid), 0) + (number(used_memory) or 0) * mib
+    except (subprocess.SubprocessError, ValueError):
+        pass
+
+    return gpus, process_memory
+
+
+def read_pressure():
+    """Reads the share of time some tasks were stalled over the last 10 seconds, in percent, for cpu, memory and io."""
+
+    res = {}
+
+    for resource in ['cpu', 'memory', 'io']:
+        text = read_file(f'/proc/pressure/{resource}')
+        if text is None:
+            continue
+
+        for line in text.splitlines():
+            kind, *values = line.split()
+            if kind != 'some':
+                continue
+
+            values = dict(x.split('=') for x in values)
+            res[resource] = float(values.get('avg10', 0))
+
+    return res
+
+
+class TelemetrySampler:
+    """
+    Samples resource usage of backend server processes and of the host in a background thread.
+
+    Per-process stats come from /proc/<pid>/stat, status, io and smaps_rollup; host stats from /proc/meminfo,
+    /proc/loadavg and /proc/pressure. GPU stats come from NVML if pynvml (the nvidia-ml-py package) is installed,
+    otherwise from running nvidia-smi. On systems without /proc, there are no per-process stats, and host memory
+    and load average are read with OS calls. The last samples are kept in bounded histories, and readers
+    only ever look at the cached samples.
+    """
+
+    def __init__(self, history_length=300):
+        self.processes: dict[str, collections.deque[ProcessSample]] = {}
+        self.host: collections.deque[HostSample] = collections.deque(maxlen=history_length)
+        self.history_length = history_length
+        self.lock = threading.Lock()
+        self.nvml_ready = None
+        self.nvidia_smi_ready = None
+
+    def init_nvml(self):
+        if self.nvml_ready is None:
+            try:
+                pynvml.nvmlInit()
+                self.nvml_ready = True
+            except Exception:
+                self.nvml_ready = False
+
+        return self.nvml_ready
+
+    def sample_gpus(self) -> tuple[list[GpuSample], dict[int, int]]:
+        """Returns GPU stats and GPU memory used by each process id."""
+
+        if pynvml is None or not self.init_nvml():
+            if self.nvidia_smi_ready is None:
+                self.nvidia_smi_ready = shutil.which('nvidia-smi') is not None
+
+            if not self.nvidia_smi_ready:
+                return [], {}
+
+            try:
+                return sample_gpus_nvidia_smi()
+            except (OSError, subprocess.SubprocessError, ValueError) as e:
+                errors.display_once(e, 'reading GPU stats from nvidia-smi')
+                return [], {}
+
+        gpus = []
+        process_memory = {}
+
+        for index in range(pynvml.nvmlDeviceGetCount()):
+            handle = pynvml.nvmlDeviceGetHandleByIndex(index)
+            memory = pynvml.nvmlDeviceGetMemoryInfo(handle)
+            name = pynvml.nvmlDeviceGetName(handle)
+
+            gpu = GpuSample(index=index, name=name.decode('utf8') if isinstance(name, bytes) else name, memory_used=memory.used, memory_total=memory.total)
+
+            try:
+                gpu.utilization = pynvml.nvmlDeviceGetUtilizationRates(handle).gpu
+                gpu.temperature = pynvml.nvmlDeviceGetTemperature(handle, pynvml.NVML_TEMPERATURE_GPU)
+            except pynvml.NVMLError:
+                pass
+
+            try:
+                for process in pynvml.nvmlDeviceGetComputeRunningProcesses(handle):
+                    process_memory[process.pid] = process_memory.get(process.pid, 0) + (process.usedGpuMemory or 0)
+            except pynvml.NVMLError:
+                pass
+
+            gpus.append(gpu)
+
+        return gpus, process_memory
+
+    def sample_host(self) -> HostSample:
+        sample = HostSample(time=time.time())
+
+        meminfo = read_kb_fields('/proc/meminfo')
+        if meminfo:
+            sample.memory_total = meminfo.get('MemTotal')
+            sample.memory_available = meminfo.get('MemAvailable')
+            sample.swap_total = meminfo.get('SwapTotal')
+            sample.swap_free = meminfo.get('SwapFree')
+        else:
+            sample.memory_total, sample.memory_available = read_memory()
+
+        loadavg = read_file('/proc/loadavg')
+        if loadavg:
+            sample.loadavg = tuple(float(x) for x in loadavg.split()[:3])
+        elif hasattr(os, 'getloadavg'):
+            try:
+                sample.loadavg = os.getloadavg()
+            except OSError:
+                pass
+
+        sample.pressure = read_pressure()
+
+        if shared.opts.model_dir and os.path.isdir(shared.opts.model_dir):
+            disk = shutil.disk_usage(shared.opts.model_dir)
+            sample.disk_total = disk.total
+            sample.disk_free = disk.free
+
+        return sample
+
+    def sample(self, pids: dict[str, int]):
+        host = self.sample_host()
+        host.gpus, gpu_memory = self.sample_gpus()
+
+        samples = {}
+        for label, pid in pids.items():
+            sample = sample_process(pid)
+            if sample is None:
+                continue
+
+            sample.gpu_memory = gpu_memory.get(pid)
+            samples[label] = sample
+
+        with self.lock:
+            self.host.append(host)
+
+            for label in list(self.processes):
+                if label not in samples:
+                    del self.processes[label]
+
+            for label, sample in samples.items():
+                history = self.processes.get(label)
+                if history is None or history[-1].pid != sample.pid:
+                    history = self.processes[label] = collections.deque(maxlen=self.history_length)
+
+                history.append(sample)
+
+    def sampler_main(self, pool):
+        while True:
+            interval = shared.opts.telemetry_interval
+            time.sleep(interval if interval > 0 else 5)
+
+            if interval <= 0:
+                continue
+
+            pids = {}
+            for bknd in pool.list_running() + pool.list_pending():
+                process = bknd.server_process
+                if process is not None and process.poll() is None:
+                    pids[bknd.model.label] = process.pid
+
+            try:
+                self.sample(pids)
+            except Exception as e:
+                errors.display_once(e, 'sampling resource usage')
+
+    def run(self, pool):
+        thread = threading.Thread(target=self.sampler_main, args=(pool,), daemon=True)
+        thread.start()
+
+    def latest_host(self) -> HostSample:
+        with self.lock:
+            return self.host[-1] if self.host else None
+
+    def latest_process(self, label) -> tuple[ProcessSample, ProcessRates]:
+        """Returns the last sample for the backend's process and rates computed against the sample before it."""
+
+        with self.lock:
+            history = self.processes.get(label)
+            if not history:
+                return None, None
+
+            last = history[-1]
+            previous = history[-2] if len(history) > 1 else None
+
+        if previous is None or last.time <= previous.time:
+            return last, None
+
+        elapsed = last.time - previous.time
+
+        def rate(name):
+            a, b = getattr(previous, name), getattr(last, name)
+            return None if a is None or b is None else (b - a) / elapsed
+
+        return last, ProcessRates(
+            cpu_percent=rate('cpu_time') * 100,
+            minor_faults=rate('minor_faults'),
+            major_faults=rate('major_faults'),
+            read_bytes=rate('read_bytes'),
+            write_bytes=rate('write_bytes'),
+        )
+
+
+sampler = TelemetrySampler()
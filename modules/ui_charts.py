@@ -0,0 +1,87 @@
+import datetime
+import time
+
+import gradio as gr
+import pandas as pd
+
+from modules import shared, models, stats_db
+
+ranges = {
+    "1 hour": 60 * 60,
+    "6 hours": 6 * 60 * 60,
+    "1 day": 24 * 60 * 60,
+    "7 days": 7 * 24 * 60 * 60,
+    "30 days": 30 * 24 * 60 * 60,
+}
+
+steps = [10, 15, 30, 60, 120, 300, 600, 900, 1800, 3600, 2 * 3600, 3 * 3600, 6 * 3600, 12 * 3600, 24 * 3600]
+
+
+def chart_step(duration, max_points=300):
+    """Smallest step from the list that fits the duration into max_points buckets; whole minutes and hours are read from rollups."""
+
+    return next((x for x in steps if duration / x <= max_points), steps[-1])
+
+
+class StatsCharts:
+    """Charts of request stats from the stats database, bucketed to a few hundred points on the server."""
+
+    def model_filter(self, model_choice):
+        if model_choice != "Selected model":
+            return None
+
+        model_info = models.models.get(shared.opts.model)
+        return model_info.path if model_info else ''
+
+    def frames(self, range_name, model_choice):
+        duration = ranges.get(range_name, ranges["1 hour"])
+        step = chart_step(duration)
+
+        end = (int(time.time()) // step + 1) * step
+        start = end - (duration // step + 1) * step
+
+        rows = {x['time']: x for x in stats_db.db.query(start, end, step, self.model_filter(model_choice))}
+
+        throughput, request_rate, token_latency, prompt_latency = [], [], [], []
+
+        for t in range(start, end, step):
+            row = rows.get(t)
+            when = datetime.datetime.fromtimestamp(t)
+
+            throughput.append((when, "Generation", row['tokens_generate'] / step if row else 0))
+            throughput.append((when, "Processing", row['tokens_process'] / step if row else 0))
+            request_rate.append((when, "Requests", row['requests'] * 60 / step if row else 0))
+
+            if row and row['tokens_generate']:
+                token_latency.append((when, "Generation", row['time_generate'] / row['tokens_generate']))
+
+            if row and row['tokens_process']:
+                prompt_latency.append((when, "Processing", row['time_process'] / row['requests']))
+
+        columns = ['time', 'series', 'value']
+
+        return [pd.DataFrame(x, columns=columns) for x in (throughput, request_rate, token_latency, prompt_latency)]
+
+    def create_ui(self, demo):
+        with gr.Row():
+            range_name = gr.Radio(list(ranges), value="1 hour", label="Period")
+            model_choice = gr.Radio(["Selected model", "All models"], value="Selected model", label="Model")
+            refresh = gr.Button("Refresh", elem_classes=['aligned-to-label'], min_width=40)
+
+        plot_args = dict(x="time", y="value", color="series", height=250, x_title="")
+
+        with gr.Row():
+            throughput = gr.LinePlot(title="Tokens/sec", y_title="tokens/sec", **plot_args)
+            request_rate = gr.LinePlot(title="Requests/min", y_title="requests/min", **plot_args)
+
+        with gr.Row():
+            token_latency = gr.LinePlot(title="Time per generated token", y_title="ms", **plot_args)
+            prompt_latency = gr.LinePlot(title="Prompt processing time per request", y_title="ms", **plot_args)
+
+        update_charts = dict(fn=self.frames, inputs=[range_name, model_choice], outputs=[throughput, request_rate, token_latency, prompt_latency], show_progress='hidden')
+
+        refresh.click(**update_charts)
+        range_name.change(**update_charts)
+        model_choice.change(**update_charts)
+        gr.Timer(30).tick(**update_charts)
+        demo.load(**update_charts)
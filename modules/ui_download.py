@@ -89,6 +89,7 @@ class DownloadTask:
     stop: bool = False
     in_progress: bool = False
     is_junk: bool = False
+    bytes_downloaded: int = 0
 
     def __post_init__(self):
         self.progress = Progress(total=self.total_size)
@@ -100,6 +101,7 @@ class HuggingfaceDownloader:
     def __init__(self):
         self.downloads: list[DownloadTask] = []
         self.lock = threading.Lock()
+        self.removed_bytes_downloaded = 0
 
     def get_downloads_html(self):
         htmls = []
@@ -244,6 +246,7 @@ class HuggingfaceDownloader:
                             if chunk:
                                 f.write(chunk)
                                 task.progress.advance(len(chunk))
+                                task.bytes_downloaded += len(chunk)
 
                 if task.stop:
                     task.status = "canceled"
@@ -316,17 +319,25 @@ class HuggingfaceDownloader:
 
             if task.in_progress:
                 task.stop = True
-            elif task.is_junk:
+                return
+
+            if task.is_junk:
                 os.unlink(task.local_path)
-                self.downloads.remove(task)
-            else:
-                self.downloads.remove(task)
+
+            self.removed_bytes_downloaded += task.bytes_downloaded
+            self.downloads.remove(task)
 
     def do_cleanup(self):
         with self.lock:
             for i in reversed(range(len(self.downloads))):
                 if not self.downloads[i].in_progress:
-                    self.downloads.pop(i)
+                    self.removed_bytes_downloaded += self.downloads.pop(i).bytes_downloaded
+
+    def total_bytes_downloaded(self):
+        """Bytes received from the network by all downloads since the launcher started."""
+
+        with self.lock:
+            return self.removed_bytes_downloaded + sum(x.bytes_downloaded for x in self.downloads)
 
     def autocalc_filename(self, file_data, selection):
         if not file_data:
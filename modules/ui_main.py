@@ -1,36 +1,103 @@
+import dataclasses
 import html
+import json
+import os
+import threading
 import time
 
 import gradio as gr
-import subprocess
-import os
 
-from modules import shared, errors, ui_download, backend, models
+from modules import shared, errors, ui_download, ui_charts, backend, backend_pool, models, utils, request_stats, telemetry, log_archive
 from modules import userscripts
 
 
-def nvidia_smi():
-    if os.name == 'nt':
-        command = 'nvidia-smi'
-    else:
-        command = 'nvidia-smi; echo; free -h; echo; df -h -T -x tmpfs'
+def system_info():
+    host = telemetry.sampler.latest_host()
+    if host is None:
+        return '*No data yet.*' if shared.opts.telemetry_interval > 0 else '*Resource usage sampling is disabled in settings.*'
+
+    size = ui_download.format_file_size
+    lines = ["| | |", "|---|---|"]
+
+    if host.memory_total and host.memory_available is not None:
+        lines.append(f"| Memory | {size(host.memory_total - host.memory_available)} used of {size(host.memory_total)}, {size(host.memory_available)} available |")
+    elif host.memory_total:
+        lines.append(f"| Memory | {size(host.memory_total)} total |")
+    if host.swap_total:
+        lines.append(f"| Swap | {size(host.swap_total - host.swap_free)} used of {size(host.swap_total)} |")
+    if host.loadavg:
+        lines.append(f"| Load average | {' '.join(f'{x:.2f}' for x in host.loadavg)} |")
+    if host.pressure:
+        lines.append(f"| Pressure, last 10s | {', '.join(f'{k} {v:.1f}%' for k, v in host.pressure.items())} |")
+    if host.disk_total:
+        lines.append(f"| Model directory disk | {size(host.disk_free)} free of {size(host.disk_total)} |")
+
+    for gpu in host.gpus:
+        extra = "".join([
+            f", {gpu.utilization}% busy" if gpu.utilization is not None else "",
+            f", {gpu.temperature}°C" if gpu.temperature is not None else "",
+        ])
+        lines.append(f"| GPU {gpu.index}: {html.escape(gpu.name)} | {size(gpu.memory_used)} used of {size(gpu.memory_total)}{extra} |")
+
+    return "\n".join(lines)
+
+
+def search_logs(query):
+    if not query:
+        return ''
 
-    return '```\n' + subprocess.check_output(command, shell=True).decode('utf8', errors='ignore') + '\n```'
+    results = log_archive.search(query)
+    if not results:
+        return '<p>Nothing found.</p>'
+
+    rows = []
+    for result in results:
+        rows.append(f"<div class='path'>{html.escape(result.alias)}: {html.escape(os.path.basename(result.path))}</div><pre>{html.escape(result.line)}</pre>")
+
+    return "".join(rows)
+
+
+@dataclasses.dataclass(frozen=True)
+class StatsSnapshot:
+    version: int = 0
+    html: str = ""
+    status: str = ""
+    is_running: bool = False
+    busy: bool = False
+    backend_key: tuple = None
 
 
 class LlmLauncher:
     def __init__(self):
         self.server_status = "Not started"
-        self.backend: backend.BackendBase = None
+        self.pool = backend_pool.BackendPool()
+        self.start_lock = threading.Lock()
 
         self.downloader = ui_download.HuggingfaceDownloader()
+        self.charts = ui_charts.StatsCharts()
         self.busy = 0
 
+        self.snapshot = StatsSnapshot()
+        self.snapshot_changed = threading.Condition()
+        self.snapshot_requested = threading.Event()
+
         for func in userscripts.on_app_init:
             func(self)
 
+    @property
+    def backend(self) -> backend.BackendBase:
+        """Backend for the model selected in the dropdown."""
+
+        return self.pool.get(shared.opts.model)
+
     def launch_at_startup(self):
-        if shared.opts.model and shared.opts.run_at_startup:
+        for bknd in self.pool.adopt():
+            bknd.run()
+            threading.Thread(target=bknd.load_info, daemon=True).start()
+
+        self.pool.save_state()
+
+        if shared.opts.model and shared.opts.run_at_startup and self.backend is None:
             for _ in self.start_server():
                 pass
 
@@ -48,6 +115,7 @@ class LlmLauncher:
             return
 
         self.busy += 1
+        self.snapshot_requested.set()
 
         try:
             yield from func()
@@ -56,136 +124,335 @@ class LlmLauncher:
             yield f'❌ {e}'
 
         self.busy -= 1
+        self.snapshot_requested.set()
 
-    def stop_server(self):
-        bknd = self.backend
+    def stop_server(self, model_label=None):
+        bknd = self.pool.get(model_label or shared.opts.model)
 
         if bknd is not None:
             self.server_status = 'Stopping...'
             yield self.server_status
 
-            bknd.stop_server()
-            self.backend = None
+            self.pool.stop(bknd.model.label)
 
-        self.server_status = '✋🏻 Stopped by user.'
+        self.server_status = '✋🏻 Stopped by user.' + (f" ({bknd.stop_report})" if bknd is not None and bknd.stop_report else "")
         yield self.server_status
 
-    def stop_server_gradio(self):
-        yield from self.runbusy(self.stop_server)
+    def stop_server_gradio(self, model_label=None):
+        yield from self.runbusy(lambda: self.stop_server(model_label))
 
-    def start_server(self):
-        model_label = shared.opts.model
+    def start_server(self, model_label=None, blue_green=None, on_demand=False):
+        model_label = model_label or shared.opts.model
         model_info = models.models.get(model_label)
         if model_info is None:
             self.server_status = f'❌ Model not found: {model_label}'
             yield self.server_status
             return
 
-        yield from self.stop_server()
-
-        bknd = model_info.backend_type()
-        self.backend = bknd
-        bknd.model = model_info
+        if blue_green is None:
+            blue_green = shared.opts.blue_green
 
-        self.server_status = 'Reading model info...'
+        self.server_status = 'Preparing backend...'
         yield self.server_status
-        try:
-            bknd.read_model_info()
-        except Exception as e:
-            errors.display(e, full_traceback=True)
 
-        self.server_status = 'Writing down template...'
-        yield self.server_status
-        try:
-            bknd.write_down_template()
-        except Exception as e:
-            errors.display(e, full_traceback=True)
+        switch_start = time.time()
+        bknd, replaced = self.pool.create(model_info, blue_green=blue_green, on_demand=on_demand)
 
         bknd.run()
+        threading.Thread(target=bknd.load_info, daemon=True).start()
+        yield bknd.status_message
+
+        if not blue_green:
+            return
+
+        while not bknd.wait_ready(1):
+            if bknd.over:
+                self.pool.discard(bknd)
+                self.server_status = f'❌ New backend failed to start, old one keeps running: {bknd.status_message}'
+                yield self.server_status
+                return
+
+            self.server_status = f'Starting new backend on port {bknd.port}: {bknd.status_message}'
+            yield self.server_status
+
+        switch_time = time.time() - switch_start
+
+        self.server_status = 'Switching to new backend, draining old one...'
+        yield self.server_status
+
+        drain_start = time.time()
+        self.pool.switch(bknd, replaced)
+        drain_time = time.time() - drain_start
+
+        reports = [x.stop_report for x in replaced if x.stop_report]
+        bknd.switchover_message = f"Switched over in {switch_time:.1f}s" + (f", old backend stopped in {drain_time:.1f}s ({'; '.join(reports)})" if reports else "")
         yield bknd.status_message
 
-    def start_server_gradio(self):
-        if not shared.opts.model:
+    def acquire_backend(self, model_name):
+        """
+        Finds the backend for a request for the model, falling back to the active backend.
+
+        A model that is still starting in blue/green mode gets its requests queued on the new backend.
+        With lazy loading enabled, a model that is not running is started.
+        """
+
+        model_info = models.find_model(model_name) if model_name else None
+        bknd = self.pool.get_serving(model_info.label) if model_info else None
+
+        if shared.opts.lazy_loading and model_info is not None:
+            with self.start_lock:
+                bknd = self.pool.get_serving(model_info.label)
+                if bknd is None or bknd.over:
+                    for _ in self.start_server(model_info.label, blue_green=False, on_demand=True):
+                        pass
+
+                    bknd = self.pool.get_serving(model_info.label)
+
+        if bknd is None:
+            bknd = self.pool.active_backend() or self.backend
+
+        return bknd
+
+    def start_server_gradio(self, model_label=None):
+        if not model_label and not shared.opts.model:
             self.server_status = 'Model not selected.'
             yield self.server_status
             return
 
-        yield from self.runbusy(self.start_server)
+        yield from self.runbusy(lambda: self.start_server(model_label))
 
     def load_status(self):
         status = None
+        version = None
 
         while self.busy:
-            if status != self.status():
-                status = self.status()
+            # the snapshot lags behind self.busy, so wait for a new one rather than for its contents
+            snapshot = self.wait_snapshot(lambda x: x.version != version, timeout=10)
+            version = snapshot.version
+            if status != snapshot.status:
+                status = snapshot.status
                 yield status
 
-            time.sleep(0.2)
-
         yield self.status()
 
-    def stats(self, current_value):
-        bknd = self.backend
+    def percentiles_ministat(self, title, sketch: request_stats.QuantileSketch, unit):
+        if not sketch.count:
+            return ""
+
+        values = " / ".join(f"{x:.0f}" if x >= 10 else f"{x:.1f}" for x in (sketch.quantile(q) for q in (0.5, 0.95, 0.99)))
+
+        return f"<span class='ministat' title='p50 / p95 / p99'>{title} p50/95/99: {values} {unit}</span>"
+
+    def server_stats_ministat(self, server_stats):
+        if server_stats is None:
+            return ""
+
+        parts = []
+        if server_stats.slots:
+            parts.append(f"Slots busy: {server_stats.busy_slots()}/{len(server_stats.slots)}")
+        elif server_stats.requests_processing is not None:
+            parts.append(f"Processing: {server_stats.requests_processing}")
+        if server_stats.requests_deferred:
+            parts.append(f"deferred: {server_stats.requests_deferred}")
+        if server_stats.kv_cache_usage is not None:
+            parts.append(f"KV cache: {server_stats.kv_cache_usage * 100:.0f}%")
+
+        return f"<span class='ministat'>{', '.join(parts)}</span>" if parts else ""
+
+    def slots_ministat(self, reader):
+        slots = reader.list_slots() if reader is not None else []
+        if len(slots) < 2:
+            return ""
+
+        per_slot = html.escape(", ".join(f"slot {x.id}: {x.requests} requests, {x.tokens_cached} cached tokens" for x in slots), quote=True)
+
+        return f"<span class='ministat' title='{per_slot}'>Concurrency: {reader.busy_slots()}, peak {reader.max_concurrency}</span>"
+
+    def resources_ministat(self, bknd):
+        sample, rates = telemetry.sampler.latest_process(bknd.model.label)
+        if sample is None:
+            return ""
+
+        size = ui_download.format_file_size
 
-        if not bknd or not bknd.server_reader:
-            return "", self.status(), gr.update(visible=True), gr.update(visible=False), gr.update(visible=False)
+        memory = f"RSS {size(sample.rss)}" + (f", VRAM {size(sample.gpu_memory)}" if sample.gpu_memory else "")
+        res = f"<span class='ministat'>{memory}</span>"
 
-        reqs_generating = [x for x in bknd.server_reader.requests if x.time_generate is not None]
-        reqs_processing = [x for x in bknd.server_reader.requests if x.time_process is not None]
+        if rates is not None:
+            res += f"<span class='ministat'>CPU {rates.cpu_percent:.0f}%, faults {rates.major_faults:.0f}/s</span>"
 
-        tokens_generated = sum(x.tokens_generate for x in reqs_generating)
-        tokens_processed = sum(x.tokens_process for x in reqs_processing)
-        time_generating = sum(x.time_generate for x in reqs_generating) / 1000
-        time_processing = sum(x.time_process for x in reqs_processing) / 1000
+            if rates.read_bytes is not None:
+                res += f"<span class='ministat'>I/O read {size(rates.read_bytes)}/s, write {size(rates.write_bytes)}/s</span>"
 
-        if self.busy:
+        return res
+
+    def stats_row(self, bknd: "backend.BackendBase"):
+        window_name = shared.opts.stats_window if shared.opts.stats_window in request_stats.windows else "30 min"
+        window = bknd.server_reader.stats.window(window_name) if bknd.server_reader else request_stats.WindowSums(0)
+        latency = bknd.server_reader.stats.latency(window_name) if bknd.server_reader else request_stats.LatencySketches()
+
+        if not bknd.info_loaded:
             loaded_model = "<em>Loading...</em>"
             build_info = '<em>Loading...</em>'
         else:
             total_params = f"{round(bknd.model_param_count / 1000000000)}B, " if bknd.model_param_count is not None else ""
             loaded_model = f"<b>{html.escape(bknd.model.path or '')}</b> <br />({html.escape(bknd.model_arch or '')}, {total_params}{(bknd.model_size or 0) / 1024 / 1024 / 1024:.1f} GB)"
-            build_info = bknd.build_info
+            build_info = bknd.build_info or '<em>Loading...</em>'
 
-        v = f"""
-<table class='stats'>
-    <thead>
-    <tr>
-        <th><span>Model</span></th>
-        <th><span>Version</span></th>
-        <th><span>Completed</span></th>
-        <th><span>Generation</span></th>
-        <th><span>Processing</span></th>
-    </tr>
-    </thead>
-    <tbody>
+        label = html.escape(bknd.model.label, quote=True)
+        dropped_lines = bknd.server_reader.bus.dropped if bknd.server_reader else 0
+
+        return f"""
     <tr>
         <td class='stat-model'>
             <span class='textstat'>{loaded_model}</span>
+            <span class='ministat'>{html.escape(bknd.status_message or '')}</span>
+            {f"<span class='ministat'>{html.escape(bknd.switchover_message)}</span>" if bknd.switchover_message else ""}
         </td>
         <td class='stat-build'>
             <span class='textstat'>{build_info}</span>
         </td>
+        <td class='stat-port'>
+            <span class='textstat'>{html.escape(str(bknd.port or ''))}</span>
+            {f"<span class='ministat'>Health: {bknd.probe_latency:.0f} ms</span>" if bknd.probe_latency is not None else ""}
+            {f"<span class='ministat'>Up {utils.format_duration(bknd.uptime())}</span>" if bknd.uptime() is not None else ""}
+            {f"<span class='ministat'>Restarts: {bknd.restart_count}</span>" if bknd.restart_count else ""}
+            {f"<span class='ministat'>Fallback profile {bknd.profile_index}</span>" if bknd.profile_index else ""}
+            {f"<span class='ministat'>Dropped log lines: {dropped_lines}</span>" if dropped_lines else ""}
+            {self.resources_ministat(bknd)}
+        </td>
         <td class='stat-requests'>
-            <span class='bigstat'>{len(bknd.server_reader.requests)}</span>
-            <span class='bigstat-subtitle'>Requests</span>
+            <span class='bigstat'>{window.requests}</span>
+            <span class='bigstat-subtitle'>Requests, {window_name}</span>
+            {self.percentiles_ministat("Generation", latency.time_generate, "ms")}
+            <span class='ministat'>Active: {bknd.active_requests}{f"/{bknd.concurrency_limit()}" if bknd.concurrency_limit() else ""}, queued: {bknd.queued_requests}</span>
+            {self.server_stats_ministat(bknd.server_stats)}
+            {self.slots_ministat(bknd.server_reader)}
         </td>
         <td class='stat-generated'>
-            <span class='bigstat'>{round(tokens_generated / time_generating, 1) if time_generating else '0'}</span>
+            <span class='bigstat'>{round(window.generate_speed(), 1)}</span>
             <span class='bigstat-subtitle'>Tokens/sec</span>
-            <span class='ministat'>Total: {tokens_generated}</span>
+            <span class='ministat'>Total: {window.tokens_generate}</span>
+            {self.percentiles_ministat("Per token", latency.time_per_token, "ms")}
         </td>
         <td class='stat-processed'>
-            <span class='bigstat'>{round(tokens_processed / time_processing, 1) if time_processing else '0'}</span>
+            <span class='bigstat'>{round(window.process_speed(), 1)}</span>
             <span class='bigstat-subtitle'>Tokens/sec</span>
-            <span class='ministat'>Total: {tokens_processed}</span>
+            <span class='ministat'>Total: {window.tokens_process}</span>
+            {f"<span class='ministat'>Cached: {window.tokens_cached}</span>" if window.tokens_cached else ""}
+            {self.percentiles_ministat("Time", latency.time_process, "ms")}
+        </td>
+        <td class='stat-actions'>
+            <div class='action' data-label='{label}' onclick='backendAction("restart", this.dataset.label)' title='Restart'>🔄</div>
+            <div class='action' data-label='{label}' onclick='backendAction("stop", this.dataset.label)' title='Stop'>⏹</div>
         </td>
     </tr>
+"""
+
+    def stats_html(self, backends):
+        if not backends:
+            return ""
+
+        footer = []
+        if shared.opts.memory_budget_gb:
+            used = sum(x.memory_size for x in backends if not x.over) / 1024 ** 3
+            footer.append(f"Resident: {used:.1f} GB of {shared.opts.memory_budget_gb:g} GB")
+
+        host = telemetry.sampler.latest_host()
+        if host is not None and host.memory_total and host.memory_available is not None:
+            footer.append(f"Host memory available: {ui_download.format_file_size(host.memory_available)} of {ui_download.format_file_size(host.memory_total)}")
+        if host is not None and host.pressure:
+            footer.append("Pressure: " + ", ".join(f"{k} {v:.1f}%" for k, v in host.pressure.items()))
+
+        footer_html = "".join(f"<span class='ministat'>{html.escape(x)}</span>" for x in footer)
+        footer_html = f"<tfoot><tr><td colspan='7'>{footer_html}</td></tr></tfoot>" if footer else ""
+
+        return f"""
+<table class='stats'>
+    <thead>
+    <tr>
+        <th><span>Model</span></th>
+        <th><span>Version</span></th>
+        <th><span>Port</span></th>
+        <th><span>Completed</span></th>
+        <th><span>Generation</span></th>
+        <th><span>Processing</span></th>
+        <th></th>
+    </tr>
+    </thead>
+    <tbody>
+{"".join(self.stats_row(x) for x in backends)}
     </tbody>
+    {footer_html}
 </table>
 """.strip()
 
-        is_running = not bknd.over
-        return (v if v != current_value else gr.update()), self.status(), gr.update(visible=not is_running), gr.update(visible=is_running), gr.update(visible=is_running)
+    def build_snapshot(self) -> StatsSnapshot:
+        bknd = self.backend
+
+        return StatsSnapshot(
+            html=self.stats_html(self.pool.list_running() + self.pool.list_pending()),
+            status=self.status(),
+            is_running=bknd is not None and not bknd.over,
+            busy=bool(self.busy),
+            backend_key=(id(bknd), bknd.ready, bknd.over, bknd.info_loaded) if bknd is not None else None,
+        )
+
+    def snapshot_producer_main(self):
+        """Rebuilds the stats snapshot once per second, or sooner when requested, and wakes up everyone waiting for it to change."""
+
+        while True:
+            try:
+                snapshot = self.build_snapshot()
+            except Exception as e:
+                errors.display_once(e, 'building stats')
+                snapshot = None
+
+            with self.snapshot_changed:
+                if snapshot is not None and dataclasses.replace(snapshot, version=self.snapshot.version) != self.snapshot:
+                    self.snapshot = dataclasses.replace(snapshot, version=self.snapshot.version + 1)
+                    self.snapshot_changed.notify_all()
+
+            self.snapshot_requested.wait(1)
+            self.snapshot_requested.clear()
+
+    def run_snapshot_producer(self):
+        thread = threading.Thread(target=self.snapshot_producer_main, daemon=True)
+        thread.start()
+
+    def wait_snapshot(self, predicate, timeout=None) -> StatsSnapshot:
+        """Waits until the predicate is true for the current snapshot, or until timeout; returns the current snapshot."""
+
+        with self.snapshot_changed:
+            self.snapshot_changed.wait_for(lambda: predicate(self.snapshot), timeout)
+            return self.snapshot
+
+    def stats(self, seen_version):
+        """Returns the current snapshot to a browser session; outputs are left unchanged if the session has already seen it."""
+
+        snapshot = self.snapshot
+        if snapshot.version == seen_version:
+            return gr.update(), gr.update(), gr.update(), gr.update(), gr.update(), seen_version
+
+        is_running = snapshot.is_running
+        return snapshot.html, snapshot.status, gr.update(visible=not is_running), gr.update(visible=is_running), gr.update(visible=is_running), snapshot.version
+
+    def tail_server_log(self, position):
+        """Returns server output the browser hasn't seen yet, as JSON for appendServerLog; position is (id of the log, offset) of what it has."""
+
+        bknd = self.backend
+        reader = bknd.server_reader if bknd is not None else None
+        if reader is None:
+            return gr.update(), position
+
+        tail_id, offset = position or (None, 0)
+        reset = tail_id != id(reader.tail)
+        text, end = reader.tail.read(0 if reset else offset)
+
+        if not reset and end == offset:
+            return gr.update(), position
+
+        return json.dumps({"reset": reset, "text": text, "offset": end}), (id(reader.tail), end)
 
     def create_ui(self, settings_ui):
         js = """
@@ -214,6 +481,19 @@ class LlmLauncher:
 
                     status = gr.Markdown(value='*Loading...*', elem_classes=['status'])
                     stats = gr.HTML(value='', elem_classes=['no-flicker', 'compact'])
+                    stats_version = gr.State(value=-1)
+                    settings_ui.render('stats_window')
+
+                    backend_restart = gr.Button("Restart", visible=False, elem_id='backend_restart')
+                    backend_stop = gr.Button("Stop", visible=False, elem_id='backend_stop')
+
+                    with gr.Accordion("Charts", open=False):
+                        self.charts.create_ui(demo)
+
+                    with gr.Accordion("Server log", open=False):
+                        gr.HTML("<pre id='server_log'></pre>")
+                        server_log_chunk = gr.Textbox(visible=False)
+                        server_log_position = gr.State(value=None)
 
                 with gr.Tab("Download"):
                     self.downloader.create_ui(demo)
@@ -221,13 +501,13 @@ class LlmLauncher:
                 with gr.Tab("Info"):
                     with gr.Accordion("System", open=False):
                         refresh_system = gr.Button("Refresh")
-                        nvidia_smi_view = gr.Markdown()
+                        system_view = gr.Markdown()
 
                     with gr.Accordion("Full command line", open=False):
                         commandline = gr.Markdown(value='')
 
-                    with gr.Accordion("Startup log", open=False):
-                        startup_log = gr.Markdown(value='')
+                    with gr.Accordion("Startup timing", open=False):
+                        startup_timing = gr.Markdown(value='')
 
                     with gr.Accordion("Chat template", open=False):
                         chat_template = gr.Markdown(value='')
@@ -235,6 +515,13 @@ class LlmLauncher:
                     with gr.Accordion("Tensors", open=False):
                         tensor_info = gr.Markdown(value='')
 
+                    with gr.Accordion("Search logs", open=False):
+                        with gr.Row():
+                            log_query = gr.Textbox(label="Text to find in logs of all runs", scale=4)
+                            log_search = gr.Button("Search", elem_classes=['aligned-to-label'], min_width=40)
+
+                        log_results = gr.HTML(elem_classes=['log-search-results'])
+
                 with gr.Tab("Settings"):
                     settings_ui.create_ui(demo)
 
@@ -244,28 +531,32 @@ class LlmLauncher:
                     return ["", "", "", ""]
 
                 return [
-                    f'```\n{bknd.startup_log}\n```',
                     bknd.model_chat_template_markdown,
                     bknd.model_tensor_info,
-                    f'```\n{bknd.commandline}\n```'
+                    f'```\n{bknd.commandline}\n```',
+                    bknd.timings_markdown(),
                 ]
 
             def wait_for_backend_func():
+                backend_key = None
+
                 while True:
-                    time.sleep(1)
+                    snapshot = self.wait_snapshot(lambda x: x.backend_key != backend_key, timeout=10)
+                    backend_key = snapshot.backend_key
 
                     bknd = self.backend
                     if bknd is None:
                         continue
 
-                    yield f'```\n{bknd.startup_log}\n```'
+                    yield init_fields_func()
 
-                    if bknd.ready or bknd.over:
+                    if (bknd.ready or bknd.over) and bknd.info_loaded:
                         break
 
-            wait_for_backend = dict(fn=wait_for_backend_func, inputs=[], outputs=[startup_log], show_progress="hidden")
-            get_info = dict(fn=init_fields_func, outputs=[startup_log, chat_template, tensor_info, commandline], show_progress="hidden")
-            get_stats = dict(fn=self.stats, inputs=[stats], outputs=[stats, status, start, stop, restart], show_progress="hidden")
+            info_fields = [chat_template, tensor_info, commandline, startup_timing]
+            wait_for_backend = dict(fn=wait_for_backend_func, inputs=[], outputs=info_fields, show_progress="hidden", concurrency_limit=None)
+            get_info = dict(fn=init_fields_func, outputs=info_fields, show_progress="hidden")
+            get_stats = dict(fn=self.stats, inputs=[stats_version], outputs=[stats, status, start, stop, restart, stats_version], show_progress="hidden", concurrency_limit=None)
             disable_buttons = dict(fn=lambda: [gr.update(interactive=False) for _ in range(3)], outputs=[start, stop, restart])
             enable_buttons = dict(fn=lambda: [gr.update(interactive=True) for _ in range(3)], outputs=[start, stop, restart])
 
@@ -273,11 +564,18 @@ class LlmLauncher:
             start.click(**disable_buttons).then(fn=self.start_server_gradio, outputs=[status], show_progress="hidden").then(**enable_buttons).then(**get_info).then(**wait_for_backend)
             restart.click(**disable_buttons).then(fn=self.start_server_gradio, outputs=[status], show_progress="hidden").then(**enable_buttons).then(**get_info).then(**wait_for_backend)
             stop.click(**disable_buttons).then(fn=self.stop_server_gradio, outputs=[status], show_progress="hidden").then(**enable_buttons).then(**get_info)
+            backend_restart.click(fn=self.start_server_gradio, inputs=[backend_restart], js="getTargetForBackendAction", outputs=[status], show_progress="hidden").then(**get_info).then(**wait_for_backend)
+            backend_stop.click(fn=self.stop_server_gradio, inputs=[backend_stop], js="getTargetForBackendAction", outputs=[status], show_progress="hidden").then(**get_info)
 
-            refresh_system.click(fn=nvidia_smi, outputs=[nvidia_smi_view])
-            demo.load(fn=nvidia_smi, outputs=[nvidia_smi_view])
+            refresh_system.click(fn=system_info, outputs=[system_view])
+            demo.load(fn=system_info, outputs=[system_view])
 
             gr.Timer(1).tick(**get_stats)
+            gr.Timer(1).tick(fn=self.tail_server_log, inputs=[server_log_position], outputs=[server_log_chunk, server_log_position], show_progress="hidden", concurrency_limit=None)
+            server_log_chunk.change(fn=None, inputs=[server_log_chunk], js="appendServerLog")
+
+            log_search.click(fn=search_logs, inputs=[log_query], outputs=[log_results])
+            log_query.submit(fn=search_logs, inputs=[log_query], outputs=[log_results])
             demo.load(api_name="get_stats", **get_stats)
 
         return demo
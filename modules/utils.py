@@ -1,3 +1,4 @@
+import os
 import re
 import socket
 import subprocess
@@ -22,6 +23,52 @@ def extract_url(text):
     return None
 
 
+def permodel_value(text, model_name, default=''):
+    """Finds the value for the model in a multiline setting with lines like `model.gguf: value`."""
+
+    entries = [x.partition(':') for x in (text or '').split('\n')]
+    return next((value.strip() for model, _, value in entries if model.strip() and model.strip().lower() in model_name.lower()), default)
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+
+    if days:
+        return f"{days}d {hours}h"
+    if hours:
+        return f"{hours}h {minutes}m"
+    if minutes:
+        return f"{minutes}m {seconds}s"
+
+    return f"{seconds}s"
+
+
+def pid_alive(pid):
+    """POSIX only: on Windows, os.kill terminates the process."""
+
+    try:
+        os.kill(pid, 0)
+        return True
+    except OSError:
+        return False
+
+
+def process_matches(pid, cmd):
+    """Checks that the process with this pid is alive and was started with this command line; returns False if the OS doesn't allow to check that."""
+
+    if os.name == 'nt' or not pid_alive(pid):
+        return False
+
+    try:
+        with open(f'/proc/{pid}/cmdline', 'rb') as f:
+            return f.read().split(b'\0')[:-1] == [x.encode('utf8') for x in cmd]
+    except OSError:
+        return False
+
+
 def get_hash(repo_path):
     try:
         result = subprocess.run(
@@ -35,3 +82,22 @@ def get_hash(repo_path):
         return result.stdout.strip()
     except (subprocess.CalledProcessError, FileNotFoundError):
         return None
+
+
+def is_port_free(port, host='0.0.0.0'):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        try:
+            s.bind((host, int(port)))
+            return True
+        except OSError:
+            return False
+
+
+def parse_port_range(text):
+    start, _, end = (text or '').partition('-')
+    start, end = start.strip(), end.strip()
+
+    if not start.isdigit():
+        return []
+
+    return list(range(int(start), int(end if end.isdigit() else start) + 1))
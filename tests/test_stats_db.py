@@ -0,0 +1,50 @@
+import time
+
+import pytest
+
+from modules import request_stats, stats_db
+
+legacy_schema = f"""
+CREATE TABLE requests (
+    time REAL NOT NULL,
+    model TEXT NOT NULL,
+    backend_type TEXT NOT NULL,
+    build TEXT,
+    {", ".join(f"{x} REAL NOT NULL DEFAULT 0" for x in stats_db.columns)}
+);
+"""
+
+
+@pytest.mark.parametrize("legacy", [False, True], ids=["current schema", "REAL token columns"])
+def test_recent_requests_load_into_request_stats(tmp_path, legacy):
+    db = stats_db.StatsDb(str(tmp_path / 'stats.db'))
+    now = time.time()
+
+    conn = db.connect()
+    try:
+        if legacy:
+            conn.executescript(legacy_schema)
+        conn.executescript(stats_db.schema)
+
+        db.write(conn, [
+            (now - 60, 'model.gguf', 'llamacpp', 'b1', 120.5, 900.25, 512, 64, 128),
+            (now - 30, 'model.gguf', 'llamacpp', 'b1', 80.0, 450.0, 256, 32, 0),
+            (now - 10, 'other.gguf', 'llamacpp', 'b1', 10.0, 20.0, 1, 1, 0),
+        ])
+    finally:
+        conn.close()
+
+    rows = db.recent_requests('model.gguf', now - 120)
+    assert [row[3:] for row in rows] == [(512, 64, 128), (256, 32, 0)]
+    assert all(isinstance(value, int) for row in rows for value in row[3:])
+
+    stats = request_stats.RequestStats()
+    for row in rows:
+        stats.add(*row, lifetime=False)
+
+    window = stats.window("30 min")
+    assert window.requests == 2
+    assert window.tokens_process == 768
+    assert window.tokens_generate == 96
+    assert window.tokens_cached == 128
+    assert stats.total.requests == 0